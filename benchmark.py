@@ -0,0 +1,282 @@
+import brian2 as b2
+import argparse
+import itertools
+import json
+import multiprocessing
+import numpy as np
+import os
+import resource
+import time
+
+from connectivity import random_fanin
+from modules import Area, connect
+from neuron_model import model_namespace
+
+# Scaled versions of the experiments of simple.py, on a chain of areas of
+# which area 0 is the lowest: keyword arguments of the lowest, middle and
+# top areas, weight arguments of connect, and whether plasticity is on by
+# default. The top area only has internal representations, as HIGH in
+# simple.py. Experiment 4 draws its lower representations from Poisson
+# inputs instead of a fixed sequence, and its plasticity is the lateral
+# plasticity of the higher areas, whose synapses have a bounded random
+# fan-out (the fanin of _chain, see the lateral argument of Area) instead
+# of being all-to-all.
+experiments = {
+    'exp1': {'low': {'IRPoisson': True}, 'middle': {'IRPoisson': True},
+             'top': {'IRPoisson': True}, 'weights': (-25, 12, 0, 0),
+             'connect': {}, 'plastic': False},
+    'exp2': {'low': {'IRPoisson': True}, 'middle': {}, 'top': {},
+             'weights': (-25, 12, -20, 25), 'connect': {}, 'plastic': False},
+    'exp3': {'low': {}, 'middle': {}, 'top': {'IRPoisson': True},
+             'weights': (-20, 12, -20, 25), 'connect': {}, 'plastic': False},
+    'exp4': {'low': {'IRPoisson': True}, 'middle': {}, 'top': {},
+             'weights': (-30, 35, -20, 20), 'connect': {'onlyPPE': True},
+             'plastic': True},
+    'exp5': {'low': {'IRPoisson': True, 'tointerneurons': True},
+             'middle': {'IRPoisson': True, 'tointerneurons': True},
+             'top': {'IRPoisson': True, 'tointerneurons': True},
+             'weights': (-35, 12, 0, 0), 'connect': {}, 'plastic': True}}
+
+def _chain(experiment:str, N:int, areas:int=2, plastic:bool=None,
+           record:bool=False, fanin:int=10, seed:int=0):
+    """Arguments of the Area and connect calls of a scaled experiment, see
+    build
+
+    Returns:
+        list: Tuples (args, kwargs) of Area, without net
+        list: Tuples (args, kwargs) of connect, with area names
+    """
+    import scipy.sparse
+    spec = experiments[experiment]
+    plastic = spec['plastic'] if plastic is None else plastic
+    wINHIPE, wEXCIPE, wINHIIR, wEXCIIR = spec['weights']
+    rng = np.random.default_rng(seed)
+    chain, links = list(), list()
+    for k in range(areas):
+        position = 'low' if k == 0 else 'top' if k == areas-1 else 'middle'
+        kwargs = dict(spec[position])
+        if k > 0 and experiment == 'exp4':
+            kwargs['lateralplasticity'] = plastic
+            kwargs['lateral'] = min(fanin, N-1)
+        chain.append(((N, 'A%d' % k), dict(
+            wINHIPE=wINHIPE, wEXCIPE=wEXCIPE, wINHIIR=wINHIIR,
+            wEXCIIR=wEXCIIR, onlyIR=k == areas-1, recordspikes=record,
+            IRgenerator=True, skipzero=True, **kwargs)))
+
+    # Random fan-in, kept by plastic prediction weights through explicit
+    # pairs (connect would otherwise make them all-to-all)
+    for k in range(1, areas):
+        i, j = random_fanin(N, N, min(fanin, N), rng)
+        W = scipy.sparse.csr_matrix((np.ones(len(i)), (i, j)), shape=(N, N))
+        links.append((('A%d' % k, 'A%d' % (k-1), W, wEXCIPE, wEXCIIR),
+                      dict(plastic=plastic and experiment != 'exp4',
+                           pairs=(i, j), skipzero=True, **spec['connect'])))
+    return chain, links
+
+def synapse_count(experiment:str, N:int, areas:int=2, plastic:bool=None,
+                  fanin:int=10):
+    """Number of synapses of a scaled experiment, predicted with
+    planner.Plan without building it
+
+    Returns:
+        int: The number of synapses
+    """
+    from planner import Plan
+    plan = Plan()
+    chain, links = _chain(experiment, N, areas, plastic, fanin=fanin)
+    for args, kwargs in chain:
+        plan.area(*args, None, **kwargs)
+    for args, kwargs in links:
+        plan.connect(*args, **kwargs)
+    return sum(s['count'] for s in plan.synapses.values())
+
+def build(net:b2.Network, experiment:str, N:int, areas:int=2,
+          plastic:bool=None, record:bool=False, fanin:int=10,
+          patterns:int=4, seed:int=0, duration:b2.Quantity=None):
+    """Build a scaled version of an experiment of simple.py: a chain of
+    areas of N neurons, each connected to the one below with random
+    prediction weights, and Poisson internal representations following
+    random binary patterns at 65 Hz, one per second
+
+    Args:
+        net (b2.Network): brian2.Network in which to build the experiment
+        experiment (str): Name of the experiment, see experiments
+        N (int): Number of neurons of each population of each area
+        areas (int, optional): Number of areas. Defaults to 2.
+        plastic (bool, optional): If True then the prediction weights (the
+                                  lateral synapses of the higher areas for
+                                  exp4) are plastic. Defaults to None, i.e.
+                                  the default of the experiment.
+        record (bool, optional): If True then record the spikes of all
+                                 populations. Defaults to False.
+        fanin (int, optional): Number of predictions received by each lower
+                               neuron, plastic or not, and number of
+                               lateral synapses of each neuron of the
+                               higher areas of exp4. Defaults to 10.
+        patterns (int, optional): Number of patterns of the Poisson
+                                  representations. Defaults to 4.
+        seed (int, optional): Seed of the weights and patterns. Defaults to
+                              0.
+        duration (b2.Quantity, optional): Duration for which the Poisson
+                                          spikes are drawn (see
+                                          Area.set_rates). Defaults to None,
+                                          i.e. one second per pattern.
+    """
+    chain, links = _chain(experiment, N, areas, plastic, record, fanin, seed)
+    rng = np.random.default_rng(seed+1)
+    built = dict()
+    for (N, name), kwargs in chain:
+        area = built[name] = Area(N, name, net, **kwargs)
+        if area.IRPoisson:
+            rates = 65*(rng.random((patterns, N)) < .3)
+            area.set_rates('rates', b2.TimedArray(rates*b2.Hz,
+                                                   dt=1*b2.second),
+                           duration)
+    for (high, low, *args), kwargs in links:
+        connect(built[high], built[low], *args, **kwargs)
+
+def measure(experiment:str, N:int, areas:int=2, plastic:bool=None,
+            record:bool=False, duration:b2.Quantity=1*b2.second,
+            seed:int=0):
+    """Build, compile and run a scaled experiment with the runtime device,
+    see build. Meant to be called in a fresh process, since the peak
+    resident memory is that of the process.
+
+    Returns:
+        dict: The parameters, the build, compile (code generation, cached
+              Cython modules being reused) and run times in s, the peak
+              resident memory in MB, the number of neurons and the number
+              of synapses
+    """
+    b2.set_device('runtime')
+    b2.seed(seed)
+    np.random.seed(seed)
+    net = b2.Network()
+    start = time.perf_counter()
+    build(net, experiment, N, areas, plastic, record, seed=seed,
+          duration=duration)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    net.run(0*b2.second, namespace=model_namespace)
+    compile_time = time.perf_counter() - start
+    start = time.perf_counter()
+    net.run(duration, namespace=model_namespace)
+    run_time = time.perf_counter() - start
+    return {'experiment': experiment, 'N': N, 'areas': areas,
+            'plastic': plastic, 'record': record,
+            'duration': float(duration/b2.second),
+            'build': build_time, 'compile': compile_time, 'run': run_time,
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                        / 1024,
+            'neurons': sum(len(obj) for obj in net.objects
+                           if isinstance(obj, (b2.NeuronGroup,
+                                               b2.SpikeGeneratorGroup))),
+            'synapses': sum(len(obj) for obj in net.objects
+                            if isinstance(obj, b2.Synapses))}
+
+def _measure(point:dict):
+    """measure(**point), in a worker of suite"""
+    return measure(**point)
+
+def suite(sizes:tuple=(10, 100, 1000, 10000, 100000), areas:tuple=(2, 3),
+          plastic:tuple=(False, True), record:tuple=(False, True),
+          duration:b2.Quantity=1*b2.second, max_synapses:int=10**8,
+          path:str=None):
+    """Measure every combination of experiment, size, number of areas,
+    plasticity and recording, one process per combination and one at a
+    time so that times and memory are not disturbed. Combinations whose
+    synapses (see synapse_count) would exceed max_synapses are skipped.
+
+    Args:
+        sizes (tuple, optional): Values of N. Defaults to 10 to 10**5.
+        areas (tuple, optional): Numbers of areas. Defaults to (2, 3).
+        plastic (tuple, optional): Plasticity settings. Defaults to (False,
+                                   True).
+        record (tuple, optional): Recording settings. Defaults to (False,
+                                  True).
+        duration (b2.Quantity, optional): Simulated duration. Defaults to
+                                          1 s.
+        max_synapses (int, optional): Bound on the number of synapses.
+                                      Defaults to 10**8.
+        path (str, optional): JSON file in which to write the results.
+                              Defaults to None.
+
+    Returns:
+        list: The measures, see measure
+    """
+    points = [{'experiment': e, 'N': n, 'areas': a, 'plastic': p,
+               'record': r, 'duration': duration}
+              for e, n, a, p, r in itertools.product(experiments, sizes,
+                                                     areas, plastic, record)
+              if synapse_count(e, n, a, p) <= max_synapses]
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        results = pool.map(_measure, points, chunksize=1)
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=1)
+    return results
+
+def compare(results:list, baseline:list, tolerance:float=.2,
+            slack:float=.05):
+    """Find the regressions of a benchmark with respect to a baseline
+
+    Args:
+        results (list): Measures, see suite
+        baseline (list): Measures of the baseline, e.g. loaded from the JSON
+                         file of a previous suite
+        tolerance (float, optional): Relative increase of a time or of the
+                                     peak memory counted as a regression.
+                                     Defaults to .2.
+        slack (float, optional): Absolute increase of a time (in s) below
+                                 which it is not counted as a regression,
+                                 for the smallest sizes. Defaults to .05.
+
+    Returns:
+        list: Strings describing the regressions (number of neurons or
+              synapses that changed, times or memory that increased)
+    """
+    keys = ('experiment', 'N', 'areas', 'plastic', 'record', 'duration')
+    reference = {tuple(r[k] for k in keys): r for r in baseline}
+    regressions = list()
+    for r in results:
+        key = tuple(r[k] for k in keys)
+        if key not in reference:
+            continue
+        b = reference[key]
+        for metric in ('neurons', 'synapses'):
+            if r[metric] != b[metric]:
+                regressions.append('%s: %s %d -> %d'
+                                   % (key, metric, b[metric], r[metric]))
+        for metric in ('build', 'compile', 'run', 'peak_rss'):
+            limit = b[metric]*(1+tolerance)
+            if metric != 'peak_rss':
+                limit = max(limit, b[metric]+slack)
+            if r[metric] > limit:
+                regressions.append('%s: %s %.3f -> %.3f'
+                                   % (key, metric, b[metric], r[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark of scaled '
+                                     'experiments of simple.py')
+    parser.add_argument('results', help='JSON file of the results')
+    parser.add_argument('--baseline', help='JSON file of a previous run, '
+                        'written from the results if it does not exist')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument('--tolerance', type=float, default=.2)
+    args = parser.parse_args()
+    results = suite(tuple(args.sizes), path=args.results)
+    if args.baseline and not os.path.exists(args.baseline):
+        # No reference numbers are shipped, since they depend on the
+        # machine: the first run becomes the baseline
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print('Baseline written to %s' % args.baseline)
+    elif args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        print('\n'.join(regressions) or 'No regression')
+        if regressions:
+            exit(1)
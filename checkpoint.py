@@ -0,0 +1,84 @@
+import brian2 as b2
+import numpy as np
+import pickle
+
+from brian2.core.variables import ArrayVariable
+from brian2.devices.cpp_standalone.device import CPPStandaloneDevice
+
+
+def _state_variables(obj:b2.Group):
+    """Names of the variables of a group that define its state: writable
+    arrays owned by the group (neuron state such as vm and w, synaptic
+    weights Wf and w_syn, STDP traces apre, apost, lastpre and lastpost,
+    ...). Synaptic indices are not stored, they are rebuilt with the
+    network.
+
+    Args:
+        obj (b2.Group): brian2.NeuronGroup, brian2.Synapses or
+                        brian2.SpikeGeneratorGroup
+
+    Returns:
+        list of str: The variable names
+    """
+    return [name for name, var in obj.variables.items()
+            if isinstance(var, ArrayVariable) and not var.read_only
+            and not var.constant and var.owner.name == obj.name
+            and not name.startswith('_')]
+
+def save_checkpoint(net:b2.Network, path:str, compressed:bool=True):
+    """Save the state of a network built with Area and connect (all neuron
+    and synapse variables, the simulation time and, with the runtime device,
+    the spikes still in the synaptic queues) in a single .npz file. Monitors
+    are not saved.
+
+    Args:
+        net (b2.Network): The network
+        path (str): .npz file to write
+        compressed (bool, optional): If True then compress the file. Defaults
+                                     to True.
+    """
+    state = {'t': np.array(float(net.t/b2.second))}
+    for obj in net.objects:
+        if not isinstance(obj, (b2.NeuronGroup, b2.Synapses,
+                                b2.SpikeGeneratorGroup)):
+            continue
+        for name in _state_variables(obj):
+            state['%s.%s' % (obj.name, name)] = \
+                obj.variables[name].get_value().copy()
+
+        # Spikes waiting for their delay (not accessible in standalone mode)
+        if isinstance(obj, b2.Synapses) \
+           and not isinstance(b2.get_device(), CPPStandaloneDevice):
+            for pathway in obj._pathways:
+                state['%s.%s._queue' % (obj.name, pathway.objname)] = \
+                    np.frombuffer(pickle.dumps(pathway._full_state()),
+                                  dtype=np.uint8)
+    (np.savez_compressed if compressed else np.savez)(path, **state)
+
+def load_checkpoint(net:b2.Network, path:str):
+    """Restore a state saved with save_checkpoint into a network built the
+    same way (same Area and connect calls), e.g. to resume learning after a
+    crash. With the standalone device, the values are set before the next
+    run, and spikes that were in the synaptic queues are lost.
+
+    Args:
+        net (b2.Network): The freshly built network
+        path (str): .npz file written by save_checkpoint
+    """
+    state = np.load(path)
+    objects = {obj.name: obj for obj in net.objects}
+    for key in state.files:
+        if key == 't':
+            continue
+        objname, name = key.split('.', 1)
+        obj = objects[objname]
+        if name.endswith('._queue'):
+            pathway = getattr(obj, name[:-len('._queue')])
+            pathway._restore_from_full_state(
+                pickle.loads(state[key].tobytes()))
+        else:
+            var = obj.variables[name]
+            assert var.size == state[key].size, \
+                   '%s does not match the checkpoint' % key
+            var.set_value(state[key])
+    net.t_ = float(state['t'])
@@ -0,0 +1,129 @@
+import numpy as np
+
+
+def pairs(mask:(np.ndarray, tuple), shape:tuple=None):
+    """Convert a connectivity mask into (presynaptic, postsynaptic) index
+    arrays, sorted by presynaptic then postsynaptic index (the order in which
+    brian2 creates all-to-all synapses).
+
+    Args:
+        mask (np.ndarray, tuple): Either a boolean (or weight) matrix of shape
+                                  (N_pre, N_post), a scipy.sparse matrix, or
+                                  a tuple (i, j) of index arrays
+        shape (tuple, optional): (N_pre, N_post), used to check indices of a
+                                 tuple mask. Defaults to None.
+
+    Returns:
+        np.ndarray: presynaptic indices
+        np.ndarray: postsynaptic indices
+    """
+    if isinstance(mask, tuple) and len(mask) == 2:
+        i, j = np.asarray(mask[0]), np.asarray(mask[1])
+    else:
+        i, j = mask.nonzero()
+    if shape is None:
+        shape = mask.shape if hasattr(mask, 'shape') else (np.max(i)+1,
+                                                             np.max(j)+1)
+    assert len(i) == 0 or (np.max(i) < shape[0] and np.max(j) < shape[1])
+    k = np.unique(i.astype(np.int64)*shape[1] + j)
+    return (k // shape[1]).astype(np.int32), (k % shape[1]).astype(np.int32)
+
+def union(shape:tuple, *masks):
+    """Union of several connectivity masks
+
+    Args:
+        shape (tuple): (N_pre, N_post)
+        Any number of masks accepted by pairs
+
+    Returns:
+        np.ndarray: presynaptic indices
+        np.ndarray: postsynaptic indices
+    """
+    ij = [pairs(m, shape) for m in masks]
+    return pairs((np.concatenate([i for i, _ in ij]),
+                  np.concatenate([j for _, j in ij])), shape)
+
+def random_fanin(n_pre:int, n_post:int, k:int, rng:np.random.Generator=None):
+    """Random connectivity where every postsynaptic neuron receives from k
+    distinct presynaptic neurons
+
+    Args:
+        n_pre (int): Number of presynaptic neurons
+        n_post (int): Number of postsynaptic neurons
+        k (int): Fan-in of each postsynaptic neuron
+        rng (np.random.Generator, optional): Random generator. Defaults to
+                                             None.
+
+    Returns:
+        np.ndarray: presynaptic indices
+        np.ndarray: postsynaptic indices
+    """
+    assert k <= n_pre
+    rng = np.random.default_rng() if rng is None else rng
+
+    # k smallest of n_pre random keys per postsynaptic neuron, by blocks of
+    # postsynaptic neurons to bound memory
+    i, j = list(), list()
+    block = max(1, 2**22 // max(n_pre, 1))
+    for start in range(0, n_post, block):
+        stop = min(n_post, start+block)
+        keys = rng.random((stop-start, n_pre))
+        i.append(np.argpartition(keys, k-1, axis=1)[:, :k].ravel() if k
+                 else np.zeros(0, dtype=int))
+        j.append(np.repeat(np.arange(start, stop), k))
+    return pairs((np.concatenate(i), np.concatenate(j)), (n_pre, n_post))
+
+def random_fanout(n_pre:int, n_post:int, k:int, rng:np.random.Generator=None):
+    """Random connectivity where every presynaptic neuron projects to k
+    distinct postsynaptic neurons
+
+    Args:
+        n_pre (int): Number of presynaptic neurons
+        n_post (int): Number of postsynaptic neurons
+        k (int): Fan-out of each presynaptic neuron
+        rng (np.random.Generator, optional): Random generator. Defaults to
+                                             None.
+
+    Returns:
+        np.ndarray: presynaptic indices
+        np.ndarray: postsynaptic indices
+    """
+    j, i = random_fanin(n_post, n_pre, k, rng)
+    return pairs((i, j), (n_pre, n_post))
+
+def receptive_fields(pre_shape:tuple, post_shape:tuple, radius:float):
+    """Topographic connectivity: both populations are laid on 2D grids
+    covering the same space, and each presynaptic neuron is connected to the
+    postsynaptic neurons within radius (in postsynaptic grid units) of its
+    position. Typically used with a higher area as presynaptic population
+    to restrict predictions to a receptive field in the lower area.
+
+    Args:
+        pre_shape (tuple): (width, height) of the presynaptic grid
+        post_shape (tuple): (width, height) of the postsynaptic grid
+        radius (float): Radius of the receptive fields
+
+    Returns:
+        np.ndarray: presynaptic indices
+        np.ndarray: postsynaptic indices
+    """
+    (pw, ph), (qw, qh) = pre_shape, post_shape
+
+    # Centers of presynaptic neurons in postsynaptic grid coordinates
+    cx = (np.arange(pw)+.5)*qw/pw - .5
+    cy = (np.arange(ph)+.5)*qh/ph - .5
+    r = int(np.ceil(radius))
+    dx, dy = np.meshgrid(np.arange(-r, r+1), np.arange(-r, r+1))
+    dx, dy = dx.ravel(), dy.ravel()
+
+    # Candidate postsynaptic positions around each center, all at once
+    y0, x0 = np.meshgrid(np.round(cy).astype(int), np.round(cx).astype(int),
+                         indexing='ij')
+    i = np.repeat(np.arange(pw*ph), len(dx))
+    x = (x0.ravel()[:, None] + dx).ravel()
+    y = (y0.ravel()[:, None] + dy).ravel()
+    ccx = np.repeat(np.tile(cx, ph), len(dx))
+    ccy = np.repeat(np.repeat(cy, pw), len(dx))
+    keep = (x >= 0) & (x < qw) & (y >= 0) & (y < qh) \
+           & ((x-ccx)**2 + (y-ccy)**2 <= radius**2)
+    return pairs((i[keep], y[keep]*qw + x[keep]), (pw*ph, qw*qh))
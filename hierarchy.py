@@ -0,0 +1,90 @@
+import brian2 as b2
+import numpy as np
+import time
+import warnings
+
+from connectivity import pairs
+from modules import Area, connect, prediction_pairs
+
+
+def build_hierarchy(areas:list, edges:list, net:b2.Network=None,
+                    skipzero:bool=True, verbose:bool=False):
+    """Build a hierarchy of Area connected with connect from a declarative
+    spec, in three stages: creation of the areas, computation of the
+    indices of all prediction synapses, and creation of the synapses.
+    Duplicate edges and paths of weight 0 are skipped.
+
+    Args:
+        areas (list): List of dicts of keyword arguments of Area, e.g.
+                      {'N': 3, 'name': 'LOW', 'wINHIPE': -25, 'wEXCIPE': 12,
+                      'IRPoisson': True}. Names must be unique.
+        edges (list): List of dicts with keys 'high' and 'low' (names of
+                      the connected areas), 'W' and/or 'mask' (if only mask
+                      is given, W is 1 on the mask), and any other keyword
+                      argument of connect, e.g. {'high': 'HIGH', 'low':
+                      'LOW', 'W': W, 'wEXCIPE': 12}
+        net (b2.Network, optional): brian2.Network in which to build the
+                                    hierarchy. Defaults to None, i.e. a new
+                                    one.
+        skipzero (bool, optional): If True then synapses of weight 0 are not
+                                   built (see Area and connect). Defaults to
+                                   True.
+        verbose (bool, optional): If True then print the build time of each
+                                  stage. Defaults to False.
+
+    Returns:
+        b2.Network: The network
+        dict: The Area indexed by name
+        dict: Build time (in s) of each stage, indexed by stage name
+    """
+    net = b2.Network() if net is None else net
+    timings = dict()
+
+    # Areas
+    start = time.perf_counter()
+    built = dict()
+    for spec in areas:
+        spec = dict(spec)
+        name = spec.pop('name')
+        if name in built:
+            raise ValueError('Area name %s is used twice' % name)
+        spec.setdefault('skipzero', skipzero)
+        built[name] = Area(spec.pop('N'), name, net, **spec)
+    timings['areas'] = time.perf_counter() - start
+
+    # Indices of the prediction synapses of all edges
+    start = time.perf_counter()
+    todo, seen = list(), set()
+    for spec in edges:
+        spec = dict(spec)
+        key = (spec.pop('high'), spec.pop('low'))
+        if key in seen:
+            warnings.warn('Skipping duplicate edge %s -> %s' % key)
+            continue
+        seen.add(key)
+        a1, a2 = built[key[0]], built[key[1]]
+        if 'W' not in spec:
+            import scipy.sparse
+            i, j = pairs(spec['mask'], (a1.N, a2.N))
+            spec['W'] = scipy.sparse.csr_matrix((np.ones(len(i)), (i, j)),
+                                                shape=(a1.N, a2.N))
+        ij = prediction_pairs(spec['W'], spec.get('plastic', False),
+                              spec.get('mask'))
+        if len(ij[0]) == 0:
+            warnings.warn('Skipping edge %s -> %s of weight 0' % key)
+            continue
+        todo.append((a1, a2, ij, spec))
+    timings['indices'] = time.perf_counter() - start
+
+    # Synapses
+    start = time.perf_counter()
+    for a1, a2, ij, spec in todo:
+        spec.setdefault('skipzero', skipzero)
+        W, wEXCIPE = spec.pop('W'), spec.pop('wEXCIPE')
+        connect(a1, a2, W, wEXCIPE, pairs=ij, **spec)
+    timings['synapses'] = time.perf_counter() - start
+
+    if verbose:
+        for stage, duration in timings.items():
+            print('%s: %.3f s' % (stage, duration))
+    return net, built, timings
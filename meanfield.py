@@ -0,0 +1,351 @@
+import brian2 as b2
+import numpy as np
+import time
+
+from connectivity import pairs
+from neuron_model import C, gL, EL, VT, DeltaT, Vcut
+from neuron_model import behaviors, common_parameters
+
+# f-I curves already computed, indexed by behavior
+_transfers = dict()
+
+
+def transfer(behavior:str):
+    """Steady-state firing rate of an AdEx neuron (see neuron_model.neurons)
+    as a function of a constant drive D, in V/s, added to dvm/dt (a
+    synaptic weight w in V receiving spikes at rate r gives D = w*r). It is
+    computed once per behavior by simulating a grid of drives for 2 s with
+    the Euler method at 0.1 ms and counting the spikes of the last second.
+
+    Args:
+        behavior (str): Electrophysiological behavior ('pe', 'ir' or 'i')
+
+    Returns:
+        np.ndarray: Drives in V/s, increasing
+        np.ndarray: Firing rates in Hz
+    """
+    if behavior in _transfers:
+        return _transfers[behavior]
+    p = dict(common_parameters, **behaviors[behavior])
+    c, gl = float(C/b2.farad), float(gL/b2.siemens)
+    el, vt = float(EL/b2.volt), float(VT/b2.volt)
+    dT, vcut = float(DeltaT/b2.volt), float(Vcut/b2.volt)
+    vr, taum = float(p['Vr']/b2.volt), float(p['taum'])
+    tauw = float(p['tauw']/b2.second)
+    a, b = float(p['a']/b2.siemens), float(p['b']/b2.amp)
+    drives = np.concatenate([[0.], np.geomspace(.01, 1000., 399)])
+    vm, w = np.full(len(drives), el), np.zeros(len(drives))
+    count = np.zeros(len(drives))
+    dt, steps = 1e-4, 20000
+    for k in range(steps):
+        dvm = (gl*(el-vm) + gl*dT*np.exp((np.minimum(vm, vcut)-vt)/dT)
+               - w)/(taum*c) + drives
+        w += dt*(a*(vm-el) - w)/tauw
+        vm += dt*dvm
+        spike = vm > vcut
+        vm[spike] = vr
+        w[spike] += b
+        if k >= steps//2:
+            count += spike
+    _transfers[behavior] = (drives, count/(steps//2*dt))
+    return _transfers[behavior]
+
+def _behavior(population:str):
+    """Behavior of a population of an Area, from its role"""
+    r = population.rsplit('_', 1)[-1]
+    return 'ir' if r == 'IR' else 'i' if r.startswith('inter') else 'pe'
+
+class MeanField:
+    """Rate-based surrogate of a network built with Area and connect: each
+    neuron has a firing rate r following tau*dr/dt = -r + f(D), with f the
+    f-I curve of its behavior (see transfer), tau its membrane time constant
+    taum*C/gL and D the sum of the weights of its synapses times the rates
+    of their presynaptic neurons. Delays and spike timing are ignored.
+    Internal representations with Poisson or predefined spike trains are
+    inputs with given rates. Build it with from_spec or from_network.
+    """
+
+    def __init__(self):
+        self.populations = dict()
+        self.inputs = dict()
+        self.connections = list()
+
+    def add_population(self, name:str, N:int, behavior:str=None):
+        """Add a population of N neurons, an input if behavior is None"""
+        self.populations[name] = (N, behavior)
+        if behavior is None:
+            self.set_rates(name, np.zeros((1, N)))
+
+    def add_connection(self, source:str, target:str, i:np.ndarray,
+                       j:np.ndarray, w:(float, np.ndarray)):
+        """Add synapses from neurons i of source to neurons j of target of
+        weights w (in mV)"""
+        w = np.broadcast_to(np.asarray(w, dtype=float), np.shape(i))
+        self.connections.append((source, target, np.asarray(i),
+                                 np.asarray(j), w*1e-3))
+
+    def set_rates(self, name:str, rates:np.ndarray, window:float=1.):
+        """Set the rates of an input population
+
+        Args:
+            name (str): Name of the population
+            rates (np.ndarray): (windows, N) rates in Hz, window k spanning
+                                [k*window, (k+1)*window[ (the last one
+                                lasting until the end)
+            window (float, optional): Duration of each window in s. Defaults
+                                      to 1.
+        """
+        self.inputs[name] = (np.atleast_2d(rates).astype(float), window)
+
+    @classmethod
+    def from_spec(cls, areas:list, edges:list):
+        """Surrogate of the network built by hierarchy.build_hierarchy from
+        the same spec, following the connections of Area and connect.
+        Lateral plastic synapses are ignored, plastic prediction weights
+        are fixed to their initial value W (thresholded at 0.5 as in
+        connect). Inputs have rate 0 until set_rates.
+
+        Args:
+            areas (list): See hierarchy.build_hierarchy
+            edges (list): See hierarchy.build_hierarchy
+
+        Returns:
+            MeanField: The surrogate
+        """
+        mf = cls()
+        spec = dict()
+        for a in areas:
+            a = dict({'wINHIIR': 0., 'wEXCIIR': 0., 'wmax': 35.}, **a)
+            spec[a['name']] = a
+            name, N = a['name'], a['N']
+            free = not (a.get('IRPoisson') or a.get('IRSet'))
+            mf.add_population(name+'_IR', N, 'ir' if free else None)
+            roles = ['interIR'] + ([] if a.get('onlyIR') else
+                                   ['NPE', 'interNPE', 'PPE', 'interPPE'])
+            for r in roles:
+                mf.add_population(name+'_'+r, N, _behavior(r))
+            k = np.arange(N)
+            def pair(p1, p2, w):
+                if w != 0:
+                    mf.add_connection(name+'_'+p1, name+'_'+p2, k, k, w)
+            if free:
+                pair('interIR', 'IR', a['wINHIIR'])
+                if not a.get('lateralplasticity'):
+                    pair('IR', 'IR', a['wmax'])
+            if a.get('tointerneurons'):
+                pair('IR', 'interIR', a['wmax'])
+            if not a.get('onlyIR'):
+                if a.get('tointerneurons'):
+                    pair('PPE', 'interPPE', a['wmax'])
+                pair('interNPE', 'NPE', a['wINHIPE'])
+                pair('interPPE', 'PPE', a['wINHIPE'])
+                pair('IR', 'interNPE', a['wmax'])
+                pair('IR', 'PPE', a['wEXCIPE'])
+                if free:
+                    pair('NPE', 'IR', a['wEXCIIR'])
+                    pair('PPE', 'interIR', a['wmax'])
+        for e in edges:
+            h, l = e['high'], e['low']
+            W = e['W'] if 'W' in e else pairs(e['mask'],
+                                              (spec[h]['N'], spec[l]['N']))
+            if isinstance(W, tuple):
+                i, j = W
+            else:
+                i, j = (W > .5).nonzero() if e.get('plastic') \
+                       else W.nonzero()
+            wmax = e.get('wmax', 35.)
+            free = not (spec[h].get('IRPoisson') or spec[h].get('IRSet'))
+            if not e.get('onlyPPE'):
+                mf.add_connection(h+'_IR', l+'_NPE', i, j, e['wEXCIPE'])
+                if free:
+                    mf.add_connection(l+'_NPE', h+'_interIR', j, i, wmax)
+            if not e.get('onlyNPE'):
+                mf.add_connection(h+'_IR', l+'_interPPE', i, j, wmax)
+                if free:
+                    mf.add_connection(l+'_PPE', h+'_IR', j, i,
+                                      e.get('wEXCIIR', 0.))
+        return mf
+
+    @classmethod
+    def from_network(cls, net:b2.Network, window:float=1.):
+        """Surrogate of a built (not necessarily run) brian2.Network: AdEx
+        populations (groups with vm), synapses between them with their
+        current weights (w_syn, gated by Wf or thetaSTDP as in
+        neuron_model.synapses), and
+        brian2.SpikeGeneratorGroup as inputs whose rates are the spike
+        counts per window (e.g. Area(IRgenerator=True) after set_rates)
+
+        Args:
+            net (b2.Network): The network
+            window (float, optional): Duration in s of the windows of the
+                                      input rates. Defaults to 1.
+
+        Returns:
+            MeanField: The surrogate
+        """
+        mf = cls()
+        for obj in net.objects:
+            if isinstance(obj, b2.SpikeGeneratorGroup):
+                mf.add_population(obj.name, len(obj))
+                t = np.asarray(obj.spike_time[:])
+                windows = int(np.ceil(np.max(t, initial=0.)/window)) + 1
+                rates = np.zeros((windows, len(obj)))
+                np.add.at(rates, ((t/window).astype(int),
+                                  np.asarray(obj.neuron_index[:])), 1/window)
+                mf.set_rates(obj.name, rates, window)
+            elif isinstance(obj, (b2.NeuronGroup, b2.Subgroup)) \
+                 and not obj.name.endswith('_neurons'):
+                if 'rates' in obj.variables:
+                    mf.add_population(obj.name, len(obj))
+                    mf.set_rates(obj.name, np.asarray(obj.rates[:])[None, :])
+                elif 'vm' in obj.variables:
+                    mf.add_population(obj.name, len(obj), _behavior(obj.name))
+
+        # Synapses between populations, i.e. not those feeding the counters
+        # of Area.count_spikes or the statistics of Area.record_variables
+        for obj in net.objects:
+            if not isinstance(obj, b2.Synapses) \
+               or 'w_syn' not in obj.variables \
+               or obj.source.name not in mf.populations \
+               or obj.target.name not in mf.populations:
+                continue
+            w = np.broadcast_to(np.asarray(obj.w_syn[:]/b2.mV), len(obj))
+            if 'thetaSTDP' in obj.variables:
+                w = float(obj.wmax[:]/b2.mV) \
+                    * (w > np.asarray(obj.thetaSTDP[:]/b2.mV))
+            if 'Wf' in obj.variables:
+                w = w*(np.asarray(obj.variables['Wf'].get_value()) > .5)
+            mf.add_connection(obj.source.name, obj.target.name, obj.i[:],
+                              obj.j[:], w)
+        return mf
+
+    def _layout(self):
+        """Offsets of the populations in the vector of all rates, and the
+        matrix of all connections"""
+        import scipy.sparse
+        offsets, n = dict(), 0
+        for name, (N, _) in self.populations.items():
+            offsets[name] = n
+            n += N
+        i = [offsets[s] + ii for s, _, ii, _, _ in self.connections]
+        j = [offsets[t] + jj for _, t, _, jj, _ in self.connections]
+        w = [ww for _, _, _, _, ww in self.connections]
+        M = scipy.sparse.csr_matrix((np.concatenate(w + [[]]),
+                                     (np.concatenate(i + [[]]).astype(int),
+                                      np.concatenate(j + [[]]).astype(int))),
+                                    shape=(n, n))
+        return offsets, n, M.T.tocsr()
+
+    def run(self, duration:b2.Quantity, dt:b2.Quantity=1*b2.ms,
+            record:b2.Quantity=None):
+        """Integrate the rates from 0, recording them at the end of each
+        recording interval
+
+        Args:
+            duration (b2.Quantity): Duration
+            dt (b2.Quantity, optional): Time step. Defaults to 1 ms.
+            record (b2.Quantity, optional): Recording interval. Defaults to
+                                            None, i.e. every time step.
+
+        Returns:
+            np.ndarray: Recording times in s
+            dict: (times, N) rates in Hz indexed by population name
+        """
+        offsets, n, MT = self._layout()
+        dt = float(dt/b2.second)
+        steps = int(round(float(duration/b2.second)/dt))
+        every = 1 if record is None \
+                else max(1, int(round(float(record/b2.second)/dt)))
+        tau = np.ones(n)
+        curves = list()
+        for name, (N, behavior) in self.populations.items():
+            if behavior is not None:
+                start = offsets[name]
+                p = behaviors[behavior]
+                tau[start:start+N] = float(p['taum']*C/gL/b2.second)
+                curves.append((slice(start, start+N), transfer(behavior)))
+        inputs = np.zeros(n, dtype=bool)
+        for name in self.inputs:
+            N = self.populations[name][0]
+            inputs[offsets[name]:offsets[name]+N] = True
+        rates = np.zeros(n)
+        times, history = list(), list()
+        for k in range(steps):
+            t = k*dt
+            for name, (values, window) in self.inputs.items():
+                start = offsets[name]
+                rates[start:start+values.shape[1]] = \
+                    values[min(int(t/window), len(values)-1)]
+            drive = MT @ rates
+            target = np.zeros(n)
+            for s, (drives, f) in curves:
+                target[s] = np.interp(drive[s], drives, f, left=0.)
+            rates = np.where(inputs, rates, rates + dt/tau*(target - rates))
+            if (k+1) % every == 0:
+                times.append(t+dt)
+                history.append(rates.copy())
+        history = np.array(history).reshape(len(times), n)
+        return np.array(times), {name: history[:, offsets[name]:
+                                                 offsets[name]+N]
+                                 for name, (N, _) in self.populations.items()}
+
+    def steady_state(self, duration:b2.Quantity=2*b2.second,
+                     dt:b2.Quantity=1*b2.ms):
+        """Rates reached with the inputs of the first window
+
+        Args:
+            duration (b2.Quantity, optional): Integration time. Defaults to
+                                              2 s.
+            dt (b2.Quantity, optional): Time step. Defaults to 1 ms.
+
+        Returns:
+            dict: Rates in Hz indexed by population name
+        """
+        inputs = self.inputs
+        self.inputs = {name: (values[:1], window)
+                       for name, (values, window) in inputs.items()}
+        try:
+            _, rates = self.run(duration, dt, duration)
+        finally:
+            self.inputs = inputs
+        return {name: r[-1] for name, r in rates.items()}
+
+def calibrate(experiments:dict, dt:b2.Quantity=.1*b2.ms, seed:int=0):
+    """Compare the surrogate with spiking simulations (see
+    validation.simulate) of a set of experiments: mean rate of each
+    recorded population and wall-clock time
+
+    Args:
+        experiments (dict): Tuples (build, duration) indexed by experiment
+                            name, see validation.simulate
+        dt (b2.Quantity, optional): Time step of the spiking simulations.
+                                    Defaults to 0.1 ms.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        dict: For each experiment and recorded population, a dict with the
+              spiking and surrogate mean rates (in Hz); for each experiment,
+              a dict with the spiking and surrogate times (in s)
+    """
+    from validation import simulate
+    results = dict()
+    for name, (build, duration) in experiments.items():
+        start = time.perf_counter()
+        recorded = simulate(build, duration, 'euler', dt, seed)
+        spiking = time.perf_counter() - start
+
+        # Same network and inputs, not run
+        b2.seed(seed)
+        net = b2.Network()
+        build(net, method='euler', IRgenerator=True)
+        start = time.perf_counter()
+        _, rates = MeanField.from_network(net).run(duration)
+        surrogate = time.perf_counter() - start
+        for monitor, (_, _, n) in recorded.items():
+            population = monitor[:-len('_RECORD')]
+            results['%s.%s' % (name, population)] = {
+                'spiking': len(recorded[monitor][0])/n
+                           / float(duration/b2.second),
+                'meanfield': float(np.mean(rates[population]))}
+        results[name] = {'spiking_time': spiking, 'meanfield_time': surrogate}
+    return results
@@ -1,7 +1,12 @@
 import brian2 as b2 
 import numpy as np 
+import os
 
-from neuron_model import neurons, synapses
+from connectivity import pairs, random_fanout, union
+from neuron_model import neurons, fused_neurons, synapses
+from neuron_model import onetoone_synapses
+from poisson import poisson_spikes
+from recording import SpikeRecorder, SpikeFile, StateRecorder
         
 
 class Area:
@@ -24,6 +29,14 @@ class Area:
                                     as following Poisson spike trains of rates
                                     defined by calling Area.set_rates. Defaults
                                     to False.
+        IRgenerator (bool, optional): If True (with IRPoisson) then the 
+                                      Poisson spike trains are drawn in 
+                                      advance by Area.set_rates, only for 
+                                      neurons of nonzero rate, and played
+                                      by a brian2.SpikeGeneratorGroup 
+                                      instead of drawing a random number
+                                      per neuron and time step. Defaults to
+                                      False.
         IRSet (bool, optional): If True then the IR population is defined as
                                 following deterministic spike trains defined by
                                 calling Area.set_spikes. Defaults to False.
@@ -35,6 +48,16 @@ class Area:
         lateralplasticity (bool, optional): If True then add lateral plastic
                                             synapses to the IR populations.
                                             Defaults to False.
+        lateral (int, tuple, optional): Connectivity of the lateral plastic
+                                        synapses: None for all pairs
+                                        (N*(N-1) synapses), an int k for a
+                                        random fan-out of k (drawn from the
+                                        numpy generator seeded by b2.seed),
+                                        or a mask accepted by
+                                        connectivity.pairs, e.g. a spatial
+                                        neighbourhood from
+                                        receptive_fields. Self-connections
+                                        are dropped. Defaults to None.
         SetSpikes (list, optional): List of spikes to force in the IR
                                     population. The list should contain tuples
                                     (index of neuron, time of spike). Defaults
@@ -43,6 +66,39 @@ class Area:
         tointerneurons (bool, optional): If True then populations project back
                                          to their associated interneurons
                                          populations. Defaults to False.
+        fused (bool, optional): If True then all the AdEx populations of the
+                                area are slices (brian2.Subgroup) of a single
+                                brian2.NeuronGroup named name+'_neurons', 
+                                which saves one state update and one 
+                                threshold/reset per population. Populations
+                                keep their names. Defaults to False.
+        onetoone (bool, optional): If True then the one-to-one connections 
+                                   inside the area are built with
+                                   onetoone_synapses (shared weight, 
+                                   homogeneous delay) instead of 'i==j'
+                                   synapses. Defaults to False.
+        batch (int, optional): Number B of independent replicas of the area
+                               simulated together. Every population holds
+                               B*N neurons, neuron k of replica b having 
+                               index b*N+k, and connections are only made
+                               inside each replica. Defaults to 1.
+        spikepath (str, optional): If given with recordspikes, spikes are 
+                                   written to files in this directory by 
+                                   recording.SpikeRecorder instead of being
+                                   kept in memory, and Area[] returns
+                                   recording.SpikeFile readers. Defaults to
+                                   None.
+        skipzero (bool, optional): If True then the one-to-one connections of
+                                   weight 0 (e.g. with the default wINHIIR 
+                                   and wEXCIIR) are not built. Defaults to
+                                   False.
+        method (str, optional): Integration method of the AdEx populations,
+                                see neuron_model.neurons. Defaults to 
+                                'euler'.
+        params (str, optional): Storage of the parameters of the AdEx
+                                populations ('neuron', 'shared' or
+                                'constant'), see neuron_model.neurons.
+                                Defaults to 'neuron'.
     """
     
     def __init__(self, N:int, name:str, net:b2.Network, wINHIPE:float,
@@ -50,66 +106,122 @@ class Area:
                  IRPoisson:bool=False, IRSet:bool=False,
                  recordspikes:bool=False, onlyIR:bool=False,
                  lateralplasticity:bool=False, SetSpikes:list=[],
-                 wmax:float=35., tointerneurons:bool=False):
+                 wmax:float=35., tointerneurons:bool=False,
+                 fused:bool=False, onetoone:bool=False, batch:int=1,
+                 spikepath:str=None, IRgenerator:bool=False,
+                 skipzero:bool=False, method:str='euler',
+                 params:str='neuron',
+                 lateral:(int, np.ndarray, tuple)=None):
         self.net = net
         self.name = name
         self.N = N
         self.IRPoisson = IRPoisson
         self.IRSet = IRSet
+        self.IRgenerator = IRgenerator
+        self.batch = batch
+        self.recorders = dict()
+        
+        # Replicas are consecutive blocks of N neurons of each population
+        M = N*batch
+        
+        # All AdEx populations of the area in a single NeuronGroup
+        if fused:
+            layout = list()
+            if not (IRPoisson or IRSet):
+                layout.append(('IR', 'ir'))
+            layout.append(('interIR', 'i'))
+            if not onlyIR:
+                layout += [('NPE', 'pe'), ('interNPE', 'i'), ('PPE', 'pe'),
+                           ('interPPE', 'i')]
+            _, pops = fused_neurons(M, layout, name=name, net=net,
+                                    method=method, params=params)
+        
+        # Poisson internal representations, drawn in advance
+        if IRPoisson and IRgenerator:
+            IR = b2.SpikeGeneratorGroup(M, [], []*b2.ms, name=name+'_IR')
+            net.add(IR)
         
         # Poisson internal representations
-        if IRPoisson:
-            IR = b2.NeuronGroup(N, 'rates : Hz', threshold='rand()<rates*dt',
+        elif IRPoisson:
+            IR = b2.NeuronGroup(M, 'rates : Hz', threshold='rand()<rates*dt',
                                 name=name+'_IR', refractory=3*b2.ms)
             net.add(IR)
             
         # Deterministic predefined spike trains internal representations
         elif IRSet:
-            IR = b2.SpikeGeneratorGroup(N, [], []*b2.ms, name=name+'_IR')
+            IR = b2.SpikeGeneratorGroup(M, [], []*b2.ms, name=name+'_IR')
             net.add(IR)
         
         # Freely evolving internal representations 
+        elif fused:
+            IR = pops['IR']
         else:
-            IR = neurons(N, name=name+'_IR', behavior='ir', net=net)
+            IR = neurons(M, name=name+'_IR', behavior='ir', net=net,
+                         method=method, params=params)
         
         # Internal representation inhibitory interneurons
-        interIR = neurons(N, name=name+'_interIR', behavior='i', net=net)
+        if fused:
+            interIR = pops['interIR']
+        else:
+            interIR = neurons(M, name=name+'_interIR', behavior='i', net=net,
+                              method=method, params=params)
+        
+        # One-to-one connections between populations of the area
+        def pair(p1, p2, w, **kwargs):
+            if skipzero and w == 0:
+                return None
+            if onetoone:
+                return onetoone_synapses(p1, p2, w, net, **kwargs)
+            return synapses(p1, p2, 'i==j', w, net, **kwargs)
         
         # IR interneurons -> IR
         # IR -> IR
         if not (IRPoisson or IRSet):
-            synapses(interIR, IR, 'i==j', wINHIIR, net)
+            pair(interIR, IR, wINHIIR)
             if not lateralplasticity:
-                synapses(IR, IR, 'i==j', wmax, net, delay=20*b2.ms)
+                pair(IR, IR, wmax, delay=20*b2.ms)
             else:
-                synapses(IR, IR, 'i!=j', 1, net, lateralSTDP=True, 
-                         delay=19.9*b2.ms)
+                synapses(IR, IR, lateral_pairs(N, batch, lateral), 1, net,
+                         lateralSTDP=True, delay=19.9*b2.ms)
         
         # IR -> IR interneurons (needed for FIG 2 F experiment)
         if tointerneurons:
-            synapses(IR, interIR, 'i==j', wmax, net, delay=10*b2.ms)
+            pair(IR, interIR, wmax, delay=10*b2.ms)
         
         # Positive and negative prediction error populations 
         # PE interneurons -> PE
         # local IR -> PPE, NPE interneurons
         # PPE -> IR interneurons, NPE -> IR
         if not onlyIR:
-            NPE = neurons(N, name=name+'_NPE', net=net)
-            interNPE = neurons(N, name=name+'_interNPE', behavior='i', net=net)
-            PPE = neurons(N, name=name+'_PPE', net=net)
-            interPPE = neurons(N, name=name+'_interPPE', behavior='i', net=net)
+            if fused:
+                NPE, interNPE = pops['NPE'], pops['interNPE']
+                PPE, interPPE = pops['PPE'], pops['interPPE']
+            else:
+                NPE = neurons(M, name=name+'_NPE', net=net, method=method,
+                              params=params)
+                interNPE = neurons(M, name=name+'_interNPE', behavior='i',
+                                   net=net, method=method, params=params)
+                PPE = neurons(M, name=name+'_PPE', net=net, method=method,
+                              params=params)
+                interPPE = neurons(M, name=name+'_interPPE', behavior='i',
+                                   net=net, method=method, params=params)
             if tointerneurons:
-                synapses(PPE, interPPE, 'i==j', wmax, net, delay=10*b2.ms)
-            synapses(interNPE, NPE, 'i==j', wINHIPE, net)
-            synapses(interPPE, PPE, 'i==j', wINHIPE, net)
-            synapses(IR, interNPE, 'i==j', wmax, net)
-            synapses(IR, PPE, 'i==j', wEXCIPE, net)
+                pair(PPE, interPPE, wmax, delay=10*b2.ms)
+            pair(interNPE, NPE, wINHIPE)
+            pair(interPPE, PPE, wINHIPE)
+            pair(IR, interNPE, wmax)
+            pair(IR, PPE, wEXCIPE)
             if not (IRPoisson or IRSet):
-                synapses(NPE, IR, 'i==j', wEXCIIR, net)
-                synapses(PPE, interIR, 'i==j', wmax, net)
+                pair(NPE, IR, wEXCIIR)
+                pair(PPE, interIR, wmax)
         
         # Recording of spikes
-        if recordspikes:
+        if recordspikes and spikepath is not None:
+            for pop in ['IR'] + ([] if onlyIR else ['NPE', 'PPE']):
+                self.recorders[pop] = SpikeRecorder(
+                    net[name+'_'+pop], os.path.join(spikepath, name+'_'+pop),
+                    name+'_'+pop+'_RECORD', net)
+        elif recordspikes:
             IRrecord = b2.SpikeMonitor(net[name+'_IR'], name=name+'_IR_RECORD')
             net.add(IRrecord)
             if not onlyIR:
@@ -120,54 +232,233 @@ class Area:
                                             name=name+'_PPE_RECORD')
                 net.add(PPErecord)
         
-        # Set spikes of neuron index at time time
-        for (index, time) in SetSpikes:
-            INITSG = b2.SpikeGeneratorGroup(1, [0], [time,]*b2.second,
-                                            name='INITSG')
+        # Set spikes of neuron index at time time: neuron k of a single 
+        # generator (named after the area) spikes at the time of entry k
+        if SetSpikes:
+            index, time = np.array(SetSpikes).T
+            index, k = index.astype(int), np.arange(len(SetSpikes))
+            INITSG = b2.SpikeGeneratorGroup(len(SetSpikes), k, 
+                                            time*b2.second,
+                                            name=name+'_INITSG')
             net.add(INITSG)
-            synapses(INITSG, IR, (0, index), wmax, net)
+            synapses(INITSG, IR, (np.tile(k, batch),
+                                  (index[None, :] + N*np.arange(batch)[:, None])
+                                  .ravel()), wmax, net)
         
-    def set_rates(self, rate_var_name:str):
+    def set_rates(self, rate_var_name:str, timedarray:b2.TimedArray=None,
+                  duration:b2.Quantity=None):
         """Set the rates of the Poisson internal representation population (if 
         it is indeed supposed to be Poisson).
         Since brian2genn does not support brian2.TimedArray as model variable,
         we pass the name of the brian2.TimedArray representing firing rates and
         call NeuronGroup.run_regularly to change firing rates every second. 
+        For a batched area, the brian2.TimedArray has B*N columns, the rates
+        of replica b being in columns b*N to (b+1)*N (e.g. np.hstack of the
+        rates of each replica).
+        With IRgenerator, the spikes are instead drawn here from the
+        brian2.TimedArray, from the current time of the network for
+        duration, and replace the spikes drawn by a previous call. As with
+        the brian2.TimedArray, the last rates hold after its end.
 
         Args:
             rate_var_name (str): Name of the brian2.TimedArray variable
+            timedarray (b2.TimedArray, optional): The brian2.TimedArray, 
+                                                  required with 
+                                                  IRgenerator. Defaults to 
+                                                  None.
+            duration (b2.Quantity, optional): With IRgenerator, duration for
+                                              which spikes are drawn, which
+                                              should cover the following
+                                              runs. Defaults to None, i.e. 
+                                              until the end of the
+                                              brian2.TimedArray.
         """
         assert self.IRPoisson
         IR = self.net[self.name+'_IR']
-        IR.run_regularly('rates = %s(t,i)'%rate_var_name, 1*b2.second)
+        if not self.IRgenerator:
+            IR.run_regularly('rates = %s(t,i)'%rate_var_name, 1*b2.second)
+            return
+        assert timedarray is not None, \
+               'IRgenerator needs the brian2.TimedArray %s' % rate_var_name
+        values = np.asarray(timedarray.values)
+        dt = float(np.asarray(timedarray.dt))
+        start = float(self.net.t/b2.second)
+        end = len(values)*dt if duration is None \
+              else start + float(duration/b2.second)
+        assert end > start, 'No spikes to draw after t=%g s' % start
+        
+        # Rates sampled every second like the run_regularly above, in the
+        # windows overlapping [start, end[
+        first = int(np.floor(start))
+        k = np.minimum((np.arange(first, int(np.ceil(end))) / dt)
+                       .astype(int), len(values)-1)
+        indices, times = poisson_spikes(values[k], 1., refractory=3e-3)
+        times = times + first
+        keep = (times >= start) & (times < end)
+        IR.set_spikes(indices[keep], times[keep]*b2.second)
         
-    def set_spikes(self, indices:(list, np.ndarray), times:(list, np.ndarray)):
+    def set_spikes(self, indices:(list, np.ndarray), times:(list, np.ndarray),
+                   replica:int=None):
         """Set the spikes of internal representations if these are set to be 
         a predefined deterministic spike train (brian2.SpikeGeneratorGroup)
 
         Args:
             indices (list, np.ndarray): indices of firing neurons
             times (list, np.ndarray): times of spikes
+            replica (int, optional): For a batched area, replica whose spikes
+                                     are set (indices are then in 0..N-1). 
+                                     If None the spikes are set for all 
+                                     replicas. Spikes previously set for 
+                                     the other replicas are kept. Defaults to
+                                     None.
         """
         assert self.IRSet
-        self.net[self.name+'_IR'].set_spikes(indices, times)    
+        IR = self.net[self.name+'_IR']
+        if self.batch == 1:
+            IR.set_spikes(indices, times)
+            return
+        indices, times = np.asarray(indices), np.asarray(times/b2.second)
+        if replica is None:
+            indices = (indices[None, :]
+                       + self.N*np.arange(self.batch)[:, None]).ravel()
+            times = np.tile(times, self.batch)
+        else:
+            keep = IR.neuron_index[:]//self.N != replica
+            indices = np.concatenate([IR.neuron_index[:][keep],
+                                      indices + self.N*replica])
+            times = np.concatenate([IR.spike_time[:][keep]/b2.second, times])
+        IR.set_spikes(indices, times*b2.second)
     
-    def record_variables(self, pop:str, name:str):
+    def record_variables(self, pop:str, name:str,
+                         variables:(str, list)='vm',
+                         record:(bool, list, np.ndarray)=True,
+                         dt:b2.Quantity=None, float32:bool=False,
+                         reduce:bool=False):
         """Record variables from population pop with a brian2.StateMonitor
 
         Args:
             pop (str): Name of the population to record from
             name (str): Name of the brian2.StateMonitor
+            variables (str, list, optional): Variable or list of variables 
+                                             to record, e.g. ['vm', 'w'].
+                                             Defaults to 'vm'.
+            record (bool, list, np.ndarray, optional): Indices of the 
+                                                       recorded neurons, or
+                                                       True for all. 
+                                                       Defaults to True.
+            dt (b2.Quantity, optional): Recording interval. Defaults to None,
+                                        i.e. every time step.
+            float32 (bool, optional): If True then values are stored in 
+                                      single precision by a 
+                                      recording.StateRecorder (runtime 
+                                      device only). Defaults to False.
+            reduce (bool, optional): If True then only the mean and variance
+                                     over the recorded neurons are recorded,
+                                     as variables <variable>_mean and
+                                     <variable>_var (population variance,
+                                     from centered values), computed
+                                     during the simulation. Defaults to
+                                     False.
+        """
+        group = self.net[self.name+'_'+pop]
+        variables = [variables] if isinstance(variables, str) else variables
+        monitorname = self.name+'_'+name+'_RECORD'
+        
+        # Population statistics are summed into a single neuron by synapses
+        # from the recorded neurons, in two passes so that the variance is
+        # a sum of centered squares (x_sq - x_mean**2 cancels and can be
+        # negative): the summed means are updated one order before the
+        # summed squares (see brian2 SummedVariableUpdater)
+        if reduce:
+            indices = np.arange(len(group)) if record is True \
+                      else np.asarray(record)
+            n = len(indices)
+            eqs, means, squares = list(), list(), list()
+            for v in variables:
+                unit = repr(b2.get_unit(group.variables[v].dim))
+                eqs += ['%s_mean : %s' % (v, unit),
+                        '%s_var : %s**2' % (v, unit)]
+                means += ['%s_mean_post = %s_pre/%d : %s (summed)' 
+                          % (v, v, n, unit)]
+                squares += ['%s_var_post = (%s_pre - %s_mean_post)**2/%d '
+                            ': %s**2 (summed)' % (v, v, v, n, unit)]
+            stats = b2.NeuronGroup(1, '\n'.join(eqs),
+                                   name=self.name+'_'+name+'_STATS')
+            s = b2.Synapses(group, stats, '\n'.join(means),
+                            name='s_%s_%s' % (group.name, stats.name))
+            s.connect(i=indices, j=0)
+            for updater in s.summed_updaters.values():
+                updater.order -= 1
+            c = b2.Synapses(group, stats, '\n'.join(squares),
+                            name='s_%s_%s_var' % (group.name, stats.name))
+            c.connect(i=indices, j=0)
+            self.net.add(stats, s, c)
+            group, record = stats, True
+            variables = [v+suffix for v in variables
+                         for suffix in ('_mean', '_var')]
+        
+        if float32:
+            self.recorders[name] = StateRecorder(group, variables, record,
+                                                 monitorname, self.net, dt=dt)
+        else:
+            self.net.add(b2.StateMonitor(group, variables, record=record,
+                                         dt=dt, name=monitorname))
+        
+    def count_spikes(self, pop:str, window:b2.Quantity=1*b2.second):
+        """Count the spikes of each neuron of population pop in consecutive
+        time windows, during the simulation. Spikes increment a per-neuron
+        counter, which is recorded and reset at the end of each window (e.g.
+        the 1 second cadence of set_rates or the presentation_time of 
+        PoissonMNIST), so that memory is O(N) per window and no spike is
+        stored. Counts are read with Area.counts.
+
+        Args:
+            pop (str): Name of the population ('IR', 'NPE', 'PPE', ...)
+            window (b2.Quantity, optional): Duration of the windows. 
+                                            Defaults to 1 second.
         """
-        record = b2.StateMonitor(self.net[self.name+'_'+pop], 'vm',
-                                 record=True,
-                                 name=self.name+'_'+name+'_RECORD')
-        self.net.add(record)
+        group = self.net[self.name+'_'+pop]
+        counter = b2.NeuronGroup(len(group), 'count : integer',
+                                 name=self.name+'_'+pop+'_COUNTER')
+        s = b2.Synapses(group, counter, on_pre='count_post += 1',
+                        name='s_%s_%s' % (group.name, counter.name))
+        s.connect(j='i')
         
+        # The monitor records the counts of the window ending at t before 
+        # they are reset
+        monitor = b2.StateMonitor(counter, 'count', record=True, dt=window,
+                                  when='start', order=0,
+                                  name=self.name+'_'+pop+'_COUNTS')
+        counter.run_regularly('count = 0', dt=window, when='start', order=1)
+        self.net.add(counter, s, monitor)
+        
+    def counts(self, pop:str):
+        """Spike counts of population pop in each window, see count_spikes
+
+        Args:
+            pop (str): Name of the population
+
+        Returns:
+            np.ndarray: (windows, N) counts, or (windows, B, N) for a batched
+                        area. The last window is the (possibly incomplete) 
+                        one running at the end of the simulation.
+        """
+        monitor = self.net[self.name+'_'+pop+'_COUNTS']
+        counter = self.net[self.name+'_'+pop+'_COUNTER']
+        t = monitor.t[:]
+        counts = np.asarray(monitor.count[:]).T[1:]
+        if len(t) == 0 or self.net.t > t[-1]:
+            counts = np.vstack([counts, np.asarray(counter.count[:])[None]])
+        if self.batch > 1:
+            counts = counts.reshape(len(counts), self.batch, self.N)
+        return counts
+    
     def __getitem__(self, key:str):
         """Get a Monitor with the Area[] syntax. SpikeMonitors are accessed
         through the keywords 'IR', 'NPE' and 'PPE'. StateMonitors are 
-        accessed with their names.
+        accessed with their names. Spikes recorded to disk are returned as
+        recording.SpikeFile. For a batched area, spikes are returned as one 
+        ReplicaSpikes per replica.
         
         Args:
             key (str): Name of monitor
@@ -175,12 +466,81 @@ class Area:
         Returns:
             brian2.SpikeMonitor or brian2.StateMonitor: The monitor
         """
-        return self.net[self.name+'_'+key+'_RECORD']
+        if key in self.recorders:
+            monitor = self.recorders[key].reader()
+        else:
+            monitor = self.net[self.name+'_'+key+'_RECORD']
+        if self.batch > 1 and isinstance(monitor, (b2.SpikeMonitor,
+                                                   SpikeFile)):
+            return [ReplicaSpikes(monitor, self.N, b)
+                    for b in range(self.batch)]
+        return monitor
+
+
+class ReplicaSpikes:
+    """Spikes of one replica of a batched Area, recorded by the 
+    brian2.SpikeMonitor of the whole population. Has the i, t, count and 
+    name attributes of a brian2.SpikeMonitor, with indices in 0..N-1, so that
+    it can be plotted with the plots module.
+
+    Args:
+        monitor (b2.SpikeMonitor): Recording of the whole population
+        N (int): Number of neurons of each replica
+        replica (int): Index of the replica
+    """
+    
+    def __init__(self, monitor:b2.SpikeMonitor, N:int, replica:int):
+        self.monitor = monitor
+        self.N = N
+        self.replica = replica
+        self.name = '%s_%d' % (monitor.name, replica)
         
+    @property
+    def i(self):
+        i = self.monitor.i[:]
+        return i[i//self.N == self.replica] - self.N*self.replica
+    
+    @property
+    def t(self):
+        return self.monitor.t[self.monitor.i[:]//self.N == self.replica]
+    
+    @property
+    def count(self):
+        return self.monitor.count[self.N*self.replica:
+                                  self.N*(self.replica+1)]
         
+        
+def lateral_pairs(N:int, batch:int=1, lateral:(int, np.ndarray, tuple)=None):
+    """Connectivity of the lateral plastic synapses of an Area
+
+    Args:
+        N (int): Number of neurons of the area
+        batch (int, optional): Number of replicas, see Area. Defaults to 1.
+        lateral (int, tuple, optional): See Area. Defaults to None.
+
+    Returns:
+        str or tuple: Condition on all pairs for brian2 if lateral is None, 
+                      else (presynaptic indices, postsynaptic indices)
+    """
+    if lateral is None:
+        return 'i!=j' if batch == 1 else 'i!=j and i//%d==j//%d' % (N, N)
+    
+    # Random fan-out among the N-1 other neurons
+    if np.isscalar(lateral):
+        rng = np.random.default_rng(np.random.randint(2**31))
+        i, j = random_fanout(N, N-1, int(lateral), rng)
+        j = j + (j >= i)
+    else:
+        i, j = pairs(lateral, (N, N))
+        i, j = i[i != j], j[i != j]
+    offsets = N*np.arange(batch)[:, None]
+    return (i[None, :] + offsets).ravel(), (j[None, :] + offsets).ravel()
+
 def connect(a1:Area, a2:Area, W:np.ndarray, wEXCIPE:float, wEXCIIR:float=0.,
             plastic:bool=False, onlyPPE:bool=False, onlyNPE:bool=False,
-            wmax:float=35., Wb:np.ndarray=None):
+            wmax:float=35., Wb:np.ndarray=None, mask:(np.ndarray, tuple)=None,
+            lr:(float, tuple)=(.045, .01), twindow:(float, tuple)=(2, 20),
+            pairs:tuple=None, skipzero:bool=False, gated:bool=False):
     """Connect two Area. a1 sends predictions to a2, and a2 sends back
     prediction errors to a1.
 
@@ -201,50 +561,176 @@ def connect(a1:Area, a2:Area, W:np.ndarray, wEXCIPE:float, wEXCIIR:float=0.,
         wmax (float, optional): Max weight. Defaults to 35.
         Wb (np.ndarray, optional): Backward weight matrix if we don't want to 
                                    initialize it as W. Defaults to None.
+        mask (np.ndarray, tuple, optional): Candidate connectivity for
+                                            learning predictions, either a
+                                            (a1.N, a2.N) matrix, a 
+                                            scipy.sparse matrix or a tuple
+                                            (i, j) of indices (see the
+                                            connectivity module). If given
+                                            with plastic=True, plastic
+                                            synapses and their learning 
+                                            state are only created for these
+                                            pairs and the nonzero entries of
+                                            W, instead of all-to-all. W can
+                                            then be a scipy.sparse matrix.
+                                            Defaults to None.
+        lr (float, tuple, optional): Learning rates of the plastic higher IR
+                                     -> NPE and higher IR -> PPE
+                                     interneurons synapses, or a single
+                                     learning rate for both. Defaults to
+                                     (.045, .01).
+        twindow (float, tuple, optional): Learning time windows (in ms) of
+                                          the same synapses, or a single
+                                          time window for both. Defaults to
+                                          (2, 20).
+        pairs (tuple, optional): (sources, targets) of the prediction 
+                                 synapses if already computed (see 
+                                 hierarchy), instead of computing them from
+                                 W and mask. Defaults to None.
+        skipzero (bool, optional): If True then the non plastic paths of 
+                                   weight 0 are not built. Defaults to 
+                                   False.
+        gated (bool, optional): If True with plastic=True, the prediction 
+                                synapses have a variable enabled, stored and
+                                shared like Wf: synapses with enabled 0 do
+                                not learn, and do not transmit while their Wf
+                                is 0 (see structural). Defaults to False.
     """
     assert a1.net == a2.net 
+    assert a1.batch == a2.batch
     assert W.shape == (a1.N, a2.N)
     net = a1.net 
+    lrN, lrP = (lr, lr) if np.isscalar(lr) else lr
+    twindowN, twindowP = (twindow, twindow) if np.isscalar(twindow) \
+                         else twindow
     
-    # No need to build synapses with weight 0
-    sources, targets = W.nonzero()
+    sources, targets = prediction_pairs(W, plastic, mask) if pairs is None \
+                       else pairs
+    if plastic:
+        W = np.asarray(W[sources, targets]).ravel()
+    
+    # Same connections inside each replica of batched areas (block-diagonal
+    # connectivity), each replica learning its own prediction weights
+    if a1.batch > 1:
+        offsets = np.arange(a1.batch)[:, None]
+        sources = (sources[None, :] + a1.N*offsets).ravel()
+        targets = (targets[None, :] + a2.N*offsets).ravel()
+        if plastic:
+            W = np.tile(W, a1.batch)
     
     # True if we want to learn prediction weights towards the 2 PE populations
     linkbool = not onlyPPE and not onlyNPE and plastic
     
+    # Paths whose weight is 0 have no effect
+    def skip(w):
+        return skipzero and not plastic and w == 0
+    
     if not onlyPPE:
         
         # Higher IR -> NPE
-        sWN = synapses(net[a1.name+'_IR'], net[a2.name+'_NPE'],
-                       (sources, targets), wEXCIPE, net,
-                       predSTDP='+-' if plastic else None, W_syn=W, 
-                       lr=0.045, twindow=2)
-
-        # Lower NPE -> IR interneurons
-        if not (a1.IRPoisson or a1.IRSet):
-            synapses(net[a2.name+'_NPE'], net[a1.name+'_interIR'],
-                     (targets, sources), wmax, net,
-                     predSTDP='--' if plastic else None)
+        if not skip(wEXCIPE):
+            sWN = synapses(net[a1.name+'_IR'], net[a2.name+'_NPE'],
+                           (sources, targets), wEXCIPE, net,
+                           predSTDP='+-' if plastic else None, W_syn=W, 
+                           lr=lrN, twindow=twindowN, sparse=plastic,
+                           gated=gated)
+
+        # Lower NPE -> IR interneurons, through the transposed prediction
+        # weights in case of prediction weight learning
+        if not (a1.IRPoisson or a1.IRSet or skip(wmax)):
+            sNI = synapses(net[a2.name+'_NPE'], net[a1.name+'_interIR'],
+                           (targets, sources), wmax, net,
+                           predSTDP='--' if plastic else None, linkw=plastic,
+                           sparse=plastic)
+            if plastic:
+                sNI.variables.add_reference('Wf', sWN, 'Wf')
             
     if not onlyNPE:
         
         # Higher IR -> PPE interneurons
-        sWP = synapses(net[a1.name+'_IR'], net[a2.name+'_interPPE'],
-                       (sources, targets), wmax, net, 
-                       predSTDP='-+' if plastic else None, linkw=linkbool,
-                       lr=0.01, twindow=20)
+        if not skip(wmax):
+            sWP = synapses(net[a1.name+'_IR'], net[a2.name+'_interPPE'],
+                           (sources, targets), wmax, net, 
+                           predSTDP='-+' if plastic else None, 
+                           linkw=linkbool, W_syn=W, lr=lrP, 
+                           twindow=twindowP, sparse=plastic, gated=gated)
         
         # In case of prediction weight learning, set weight matrices toward
         # NPE and PPE to be the same
         if linkbool:
             sWP.variables.add_reference('Wf', sWN, 'Wf')
+            if gated:
+                sWP.variables.add_reference('enabled', sWN, 'enabled')
             
-        # Lower PPE -> IR
-        if not (a1.IRPoisson or a1.IRSet):
-            synapses(net[a2.name+'_PPE'], net[a1.name+'_IR'],
-                     (targets, sources), wEXCIIR, net,
-                     predSTDP='++' if plastic else None)
-            
+        # Lower PPE -> IR, through the transposed prediction weights in case
+        # of prediction weight learning
+        if not (a1.IRPoisson or a1.IRSet or skip(wEXCIIR)):
+            sPI = synapses(net[a2.name+'_PPE'], net[a1.name+'_IR'],
+                           (targets, sources), wEXCIIR, net,
+                           predSTDP='++' if plastic else None, linkw=plastic,
+                           sparse=plastic)
+            if plastic:
+                sPI.variables.add_reference('Wf', sWP, 'Wf')
+
+
+def prediction_pairs(W:np.ndarray, plastic:bool=False,
+                     mask:(np.ndarray, tuple)=None):
+    """(presynaptic, postsynaptic) indices of the prediction synapses built
+    by connect
+
+    Args:
+        W (np.ndarray): prediction weight matrix, or scipy.sparse matrix
+        plastic (bool, optional): See connect. Defaults to False.
+        mask (np.ndarray, tuple, optional): See connect. Defaults to None.
+
+    Returns:
+        np.ndarray: presynaptic indices
+        np.ndarray: postsynaptic indices
+    """
     
+    # No need to build synapses with weight 0
+    if not plastic:
+        return W.nonzero()
     
-    
\ No newline at end of file
+    # Plastic prediction weights are learned for every pair (all-to-all) or
+    # for the candidate pairs of mask, each synapse with its own initial 
+    # weight. Pairs are explicit so that feedback synapses can be built with
+    # the transposed pairs in the same order 
+    if mask is not None:
+        return union(W.shape, W, mask)
+    return np.divmod(np.arange(W.shape[0]*W.shape[1]), W.shape[1])
+
+def prediction_weights(a1:Area, a2:Area, sparse:bool=False):
+    """Read the learned prediction weights Wf from the higher area a1 to the
+    lower area a2 connected with connect(a1, a2, W, ..., plastic=True)
+
+    Args:
+        a1 (Area): The higher area
+        a2 (Area): The lower area
+        sparse (bool, optional): If True then return a scipy.sparse.csr_matrix
+                                 with entries only for existing synapses, else
+                                 a dense np.ndarray. Defaults to False.
+
+    Returns:
+        np.ndarray or scipy.sparse.csr_matrix: (a1.N, a2.N) weight matrix.
+                                               For batched areas, a
+                                               (B, a1.N, a2.N) np.ndarray or
+                                               a list of B sparse matrices
+    """
+    net = a1.net
+    name = 's_%s_IR_%s_NPE' % (a1.name, a2.name)
+    if name not in net:
+        name = 's_%s_IR_%s_interPPE' % (a1.name, a2.name)
+    s = net[name]
+    i, j = s.i[:], s.j[:]
+    Wf = s.Wf.variable.get_value()
+    b, i, j = i // a1.N, i % a1.N, j % a2.N
+    if sparse:
+        import scipy.sparse
+        Ws = [scipy.sparse.csr_matrix((Wf[b==k], (i[b==k], j[b==k])),
+                                      shape=(a1.N, a2.N))
+              for k in range(a1.batch)]
+        return Ws[0] if a1.batch == 1 else Ws
+    W = np.zeros((a1.batch, a1.N, a2.N))
+    W[b, i, j] = Wf
+    return W[0] if a1.batch == 1 else W
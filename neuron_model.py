@@ -12,7 +12,43 @@ taupre = taupost = 20 * b2.ms
 Apre = .1
 Apost = -.1
 
-def neurons(n:int, behavior:str='pe', name:str='', net:b2.Network=None):
+# Namespace of the parameters above, for running networks from code that
+# does not import them (brian2 otherwise resolves them in the namespace of
+# the function calling run)
+model_namespace = {'C': C, 'gL': gL, 'EL': EL, 'VT': VT, 'DeltaT': DeltaT,
+                   'Vcut': Vcut, 'taupre': taupre, 'taupost': taupost,
+                   'Apre': Apre, 'Apost': Apost}
+
+def set_precision(precision:str='double'):
+    """Set the precision of the floating point variables of the objects
+    created afterwards: neuron state (vm, w, ...), synaptic weights (w_syn,
+    Wf) and traces, and the values recorded by monitors. brian2.TimedArray
+    always stores float64 values (see Area(IRgenerator=True) to do without
+    them).
+
+    Args:
+        precision (str, optional): 'double' (float64, the brian2 default) or
+                                   'single' (float32, half the memory).
+                                   Defaults to 'double'.
+    """
+    dtypes = {'double': np.float64, 'single': np.float32}
+    if precision not in dtypes:
+        raise NotImplementedError
+    b2.prefs.core.default_float_dtype = dtypes[precision]
+
+# Parameters of the populations, common to all of them and depending on
+# their electrophysiological behavior: prediction error neurons ('pe'),
+# internal representation neurons ('ir') and interneurons ('i')
+neuron_parameters = {'tauw': 'second', 'a': 'siemens', 'b': 'amp',
+                     'Vr': 'volt', 'taum': '1'}
+common_parameters = {'a': 4*b2.nS, 'b': 0.0805*b2.nA, 'Vr': -70.6*b2.mV}
+behaviors = {'pe': {'tauw': 400*b2.ms, 'taum': 6},
+             'ir': {'tauw': 55*b2.ms, 'taum': 3},
+             'i': {'tauw': 10*b2.ms, 'taum': 1}}
+
+def neurons(n:int, behavior:str='pe', name:str='', net:b2.Network=None,
+            method:str='euler', params:str='neuron',
+            heterogeneous:tuple=()):
     """Create a brian2.NeuronGroup following the Adex neuron model
     dvm/dt = (gL*(EL - vm) + gL*DeltaT*exp((vm - VT)/DeltaT) + I - w)/(taum*C) 
     dw/dt = (a*(vm - EL) - w)/tauw 
@@ -24,58 +60,144 @@ def neurons(n:int, behavior:str='pe', name:str='', net:b2.Network=None):
         name (str, optional): name if the population. Defaults to ''.
         net (b2.Network, optional): brian2.Network in which to add the
                                     population. Defaults to None.
+        method (str, optional): Integration method: any explicit brian2
+                                method ('euler', 'rk2', 'rk4', 'heun'), 
+                                'exponential_euler', which integrates the
+                                linear part exactly with the exponential 
+                                term frozen over each time step (not more
+                                accurate than Euler on this model), or 
+                                'clipped_euler', which is Euler with vm 
+                                clipped at Vcut inside the exponential so 
+                                that a large time step cannot make it 
+                                explode. See validation.validate_neurons to
+                                compare methods. Defaults to 'euler'.
+        params (str, optional): Storage of the parameters tauw, a, b, Vr and
+                                taum: 'neuron' (one value per neuron),
+                                'shared' (one value for the population) or
+                                'constant' (compile-time constants, which
+                                cannot be changed after creation). Defaults
+                                to 'neuron'.
+        heterogeneous (tuple, optional): Names of the parameters that keep
+                                         one value per neuron whatever
+                                         params, e.g. ('tauw',) to draw
+                                         heterogeneous adaptation time
+                                         constants. Defaults to ().
     
     Returns:
         brian2.NeuronGroup: The population
     """
-    
+    if params not in ('neuron', 'shared', 'constant') \
+       or behavior not in behaviors:
+        raise NotImplementedError
+    values = dict(common_parameters, **behaviors[behavior])
+
     # Adex Neuron model http://www.scholarpedia.org/article/Adaptive_exponential_integrate-and-fire_model
     # We also added a time constant taum compared with the classical 
     # implementation, that differs with neuron type (IR, PE, intenreuron) 
     eqs = '''
-    dvm/dt = (gL*(EL-vm)+gL*DeltaT*exp((vm-VT)/DeltaT) + I - w)/(taum*C) : volt
+    dvm/dt = (gL*(EL-vm)+%s + I - w)/(taum*C) : volt
     dw/dt = (a*(vm - EL) - w)/tauw : amp
     I : amp
-    tauw : second
-    a : siemens
-    b : amp
-    Vr : volt
-    taum : 1
     '''
-    group = b2.NeuronGroup(n, eqs, threshold='vm>Vcut', reset="vm=Vr; w+=b",
-                           method='euler', name=name)
-    group.vm = EL
-    group.a = 4*b2.nS
-    group.b = 0.0805*b2.nA
-    group.Vr = -70.6*b2.mV
-    
-    # Prediction error neurons
-    if behavior == 'pe':
-        group.tauw = 400*b2.ms
-        group.taum = 6
-    
-    # Internal representation neurons
-    elif behavior == 'ir':
-        group.tauw = 55*b2.ms
-        group.taum = 3
+
+    # Parameters are variables of the group, or constants resolved in its
+    # namespace when the code is generated
+    namespace, variables = dict(), list()
+    for param, unit in neuron_parameters.items():
+        if params == 'constant' and param not in heterogeneous:
+            namespace[param] = values[param]
+            continue
+        shared = params == 'shared' and param not in heterogeneous
+        eqs += '%s : %s%s\n' % (param, unit, ' (shared)' if shared else '')
+        variables.append(param)
     
-    # Interneurons
-    elif behavior == 'i':
-        group.tauw = 10*b2.ms
-        group.taum = 1
-        
+    # The exponential term is a parameter updated at the start of each time
+    # step, so that brian2 sees equations linear in vm
+    if method == 'exponential_euler':
+        eqs = eqs % 'Iexp' + 'Iexp : amp'
+        code = 'Iexp = gL*DeltaT*exp((vm-VT)/DeltaT)'
+    elif method == 'clipped_euler':
+        eqs = eqs % 'gL*DeltaT*exp((clip(vm, -inf*mV, Vcut)-VT)/DeltaT)'
+        method = 'euler'
     else:
-        raise NotImplementedError
+        eqs = eqs % 'gL*DeltaT*exp((vm-VT)/DeltaT)'
+    group = b2.NeuronGroup(n, eqs, threshold='vm>Vcut', reset="vm=Vr; w+=b",
+                           method=method, name=name,
+                           namespace=namespace or None)
+    if method == 'exponential_euler':
+        group.run_regularly(code, when='start')
+    group.vm = EL
+    for param in variables:
+        setattr(group, param, values[param])
 
     if net is not None:
         net.add(group)
     return group 
 
+def set_behavior(group:b2.Group, behavior:str='pe'):
+    """Set the parameters of a population (or of a slice of a population)
+    that depend on its electrophysiological behavior
+
+    Args:
+        group (b2.Group): brian2.NeuronGroup or brian2.Subgroup created by
+                          neurons
+        behavior (str, optional): Electrophysiological behavior. Defaults to 
+                                  'pe'
+    """
+    if behavior not in behaviors:
+        raise NotImplementedError
+    for param, value in behaviors[behavior].items():
+        setattr(group, param, value)
+
+def fused_neurons(n:int, layout:list, name:str='', net:b2.Network=None,
+                  method:str='euler', params:str='neuron'):
+    """Create a single brian2.NeuronGroup following the Adex neuron model,
+    named name+'_neurons', holding several populations of n neurons as
+    consecutive slices. Each population is a brian2.Subgroup named 
+    name+'_'+role, so that it can be used (and found in a brian2.Network) 
+    like a population created by neurons, while the whole group shares a
+    single state update and threshold/reset.
+
+    Args:
+        n (int): Number of neurons of each population
+        layout (list): List of tuples (role, behavior), one per population,
+                       in the order of the slices
+        name (str, optional): name prefix of the populations. Defaults to ''.
+        net (b2.Network, optional): brian2.Network in which to add the
+                                    group and its populations. Defaults to 
+                                    None.
+        method (str, optional): Integration method, see neurons. Defaults to
+                                'euler'.
+        params (str, optional): Storage of the parameters, see neurons. The
+                                parameters that depend on the behavior keep
+                                one value per neuron when the layout mixes
+                                behaviors. Defaults to 'neuron'.
+
+    Returns:
+        brian2.NeuronGroup: The fused group
+        dict: The populations (brian2.Subgroup) indexed by role
+    """
+    kinds = set(behavior for _, behavior in layout)
+    heterogeneous = tuple(behaviors['pe']) if len(kinds) > 1 else ()
+    group = neurons(n*len(layout), behavior=layout[0][1],
+                    name=name+'_neurons', net=net, method=method,
+                    params=params, heterogeneous=heterogeneous)
+    populations = dict()
+    for k, (role, behavior) in enumerate(layout):
+        pop = b2.Subgroup(group, k*n, (k+1)*n, name=name+'_'+role)
+        if heterogeneous:
+            set_behavior(pop, behavior)
+        populations[role] = pop
+        if net is not None:
+            net.add(pop)
+    return group, populations
+
 def synapses(p1:str, p2:str, motif:(None, str, list, tuple, np.ndarray),
              w:float, net:b2.Network, lateralSTDP:bool=False,
              namesup:str='', wmax:float=35, predSTDP:str=None,
              linkw:bool=False, W_syn:np.ndarray=None, lr:float=.01, 
-             twindow:float=1, **kwargs):
+             twindow:float=1, sparse:bool=False, gated:bool=False,
+             **kwargs):
     """Add brian2.Synapses between population p1 and p2
 
     Args:
@@ -96,7 +218,12 @@ def synapses(p1:str, p2:str, motif:(None, str, list, tuple, np.ndarray),
         wmax (float, optional): Max weight, usually sufficient to activate post
                                 synaptic neuron with one presynaptic spike.
                                 Defaults to 35**kwargs.
-        predSTDP (str, optional): STDP learning rules for long range synapses
+        predSTDP (str, optional): STDP learning rules for long range synapses:
+                                  '+-' (higher IR -> lower NPE), '-+' 
+                                  (higher IR -> lower PPE interneurons), and
+                                  the feedback rules '--' (lower NPE -> 
+                                  higher IR interneurons) and '++' (lower 
+                                  PPE -> higher IR), which need linkw.
                                   Defaults to None.
         linkw (bool, optional): Are weights copied from another population?
                                 Defaults to False.
@@ -106,6 +233,16 @@ def synapses(p1:str, p2:str, motif:(None, str, list, tuple, np.ndarray),
         twindow (float, optional): the time window in which a pair of post and 
                                    pre - synaptic spikes must fall to be
                                    considered for learning 
+        sparse (bool, optional): If True then synapses following predSTDP 
+                                 are only created for the pairs given by 
+                                 motif, and W_syn holds one initial weight
+                                 per synapse (in the order of motif) instead 
+                                 of a full weight matrix. Otherwise they are
+                                 all-to-all. Defaults to False.
+        gated (bool, optional): If True then synapses following predSTDP 
+                                '+-' or '-+' only learn when their variable
+                                enabled (stored with Wf, initially 1) is 1.
+                                Defaults to False.
 
     Returns:
         b2.Synapses: The synaptic complex 
@@ -114,7 +251,7 @@ def synapses(p1:str, p2:str, motif:(None, str, list, tuple, np.ndarray),
     # Lateral IR->IR synapse and STDP model for sequence learning
     if lateralSTDP:
         model = '''w_syn : volt
-                   thetaSTDP : volt
+                   thetaSTDP : volt (shared)
                    dapre/dt = -apre/taupre : 1 (event-driven)
                    dapost/dt = -apost/taupost : 1 (event-driven)
                    wmax : volt (shared)'''
@@ -124,24 +261,41 @@ def synapses(p1:str, p2:str, motif:(None, str, list, tuple, np.ndarray),
         onpost = '''apost += Apost
                     w_syn = clip(w_syn+wmax*apre*int(apre>.1), 0*mV, wmax)'''
 
-    # Higher IR -> PE synapse and STDP model for prediction weight learning 
+    # Lower PE -> higher IR feedback synapses of prediction weight learning.
+    # They transmit prediction errors through the learned prediction weights
+    # Wf, which are not stored here but referenced from the forward synapses
+    # (linkw) built with the transposed pairs in the same order, so that 
+    # synapse k of the feedback reads Wf of forward synapse k. Wf is only
+    # updated by the forward rules, which already see every pre/post pairing
+    # of the loop
+    elif predSTDP in ('--', '++'):
+        assert linkw
+        model = 'w_syn : volt (shared)'
+        onpre = 'vm+=w_syn*int(Wf>0.5)'
+        onpost = ''
+    
+    # Higher IR -> PE synapse and STDP model for prediction weight learning,
+    # gated by enabled if needed (see structural)
     elif predSTDP:
         model = '''w_syn : volt (shared) 
                    lr : 1 (shared)
                    twindow : second (shared)
                    lastpost : second 
                    lastpre : second 
-                   %s ''' % ('Wf:1' if not linkw else '')
+                   %s 
+                   %s ''' % ('Wf:1' if not linkw else '',
+                             'enabled:1' if gated and not linkw else '')
+        gate = '*enabled' if gated else ''
         if predSTDP == '-+':
             onpre = '''vm+=w_syn*int(Wf>0.5)
-                       Wf = clip(Wf+lr*int((t-lastpost)<twindow), 0, 1)
-                       lastpre = t'''
+                       Wf = clip(Wf+lr%s*int((t-lastpost)<twindow), 0, 1)
+                       lastpre = t''' % gate
             onpost = '''lastpost = t'''
         elif predSTDP == '+-':
             onpre = '''vm+=w_syn*int(Wf>0.5)
                        lastpre = t'''
-            onpost = '''Wf = clip(Wf-lr*int((t-lastpre)<twindow), 0, 1)
-                        lastpost = t'''
+            onpost = '''Wf = clip(Wf-lr%s*int((t-lastpre)<twindow), 0, 1)
+                        lastpost = t''' % gate
     
     # Synapse model with no learning 
     else:
@@ -154,7 +308,8 @@ def synapses(p1:str, p2:str, motif:(None, str, list, tuple, np.ndarray),
                     name='s_%s_%s'%(p1.name, p2.name) + ('_%s'%namesup if namesup else ''))
     
     # Connect synapses 
-    if motif is None or motif == 'all' or predSTDP is not None:
+    if motif is None or motif == 'all' or (predSTDP is not None
+                                           and not sparse):
         s.connect()
     elif isinstance(motif, str):
         s.connect(motif)
@@ -165,16 +320,51 @@ def synapses(p1:str, p2:str, motif:(None, str, list, tuple, np.ndarray),
     
     # Set synapses model parameters
     s.w_syn = w*b2.mV
-    if predSTDP:
+    if predSTDP in ('-+', '+-'):
         s.lastpost = 0*b2.ms
         s.lastpre = 0*b2.ms
         s.lr = lr
         s.twindow = twindow*b2.ms
         if not linkw:
             s.Wf = W_syn.flatten()
+            if gated:
+                s.enabled = 1
     elif lateralSTDP:
         s.wmax = wmax*b2.mV
         
     if net is not None:
         net.add(s)
-    return s
\ No newline at end of file
+    return s
+
+def onetoone_synapses(p1:b2.Group, p2:b2.Group, w:float, net:b2.Network,
+                      namesup:str='', **kwargs):
+    """Add one-to-one brian2.Synapses between populations p1 and p2 of the
+    same size: a spike of neuron i of p1 increments vm of neuron i of p2 by w.
+    Contrary to synapses(p1, p2, 'i==j', w, net), the weight is a single 
+    shared variable, the connection is built with a generator in linear time 
+    instead of testing all N^2 pairs, and a delay passed as keyword argument
+    is homogeneous, so that no per-synapse weight or delay is stored. The
+    resulting dynamics are the same.
+
+    Args:
+        p1 (b2.Group): The projecting population (brian2.NeuronGroup,
+                       subgroup or brian2.SpikeGeneratorGroup)
+        p2 (b2.Group): The receiving population (brian2.NeuronGroup or
+                       subgroup)
+        w (float): Weight of the synapses
+        net (b2.Network): brian2.Network containing populations p1 and p2
+                          and to which we add the synapses.
+        namesup (str, optional): Supplement of name, see synapses. Defaults 
+                                 to ''.
+
+    Returns:
+        b2.Synapses: The synaptic complex 
+    """
+    assert net[p1.name].N == net[p2.name].N
+    s = b2.Synapses(net[p1.name], net[p2.name], model='w_syn : volt (shared)',
+                    on_pre='vm+=w_syn', **kwargs,
+                    name='s_%s_%s'%(p1.name, p2.name) + ('_%s'%namesup if namesup else ''))
+    s.connect(j='i')
+    s.w_syn = w*b2.mV
+    net.add(s)
+    return s
@@ -5,7 +5,113 @@ from neuron_model import C, gL, EL, VT, DeltaT, Vcut
 from neuron_model import neurons
 
 
-def Addconverge(net:b2.Network, a:str, b:str, centerw:float, surroundw:float):
+def conv_connectivity(in_shape:tuple, kernel:np.ndarray, stride:int=1):
+    """Connectivity of a 2D convolution with 'same' padding (connections
+    falling outside of the input are dropped), computed in one vectorized
+    pass. Neuron (c, y, x) of a population laid out as (width, height, 
+    channels) has index c*width*height + y*width + x.
+
+    Args:
+        in_shape (tuple): (width, height) or (width, height, channels) of
+                          the projecting population
+        kernel (np.ndarray): Weights, either a (kh, kw) kernel applied to 
+                             each channel separately (as many output as
+                             input channels), or a (out_channels, 
+                             in_channels, kh, kw) kernel
+        stride (int, optional): Stride of the convolution. Defaults to 1.
+
+    Returns:
+        np.ndarray: presynaptic indices
+        np.ndarray: postsynaptic indices
+        np.ndarray: weights
+        tuple: (width, height, channels) of the receiving population
+    """
+    w, h, c = tuple(in_shape) + (1,)*(3-len(in_shape))
+    kernel = np.asarray(kernel, dtype=float)
+    kh, kw = kernel.shape[-2:]
+    wo, ho = (w-1)//stride + 1, (h-1)//stride + 1
+    
+    # All (out channel, in channel, out y, out x, kernel y, kernel x) at 
+    # once, with the in channel equal to the out channel for a per-channel
+    # kernel (memory linear in channels)
+    if kernel.ndim == 2:
+        co = c
+        n, yo, xo, dy, dx = np.meshgrid(np.arange(c), np.arange(ho),
+                                        np.arange(wo), np.arange(kh),
+                                        np.arange(kw), indexing='ij')
+        o, weight = n, kernel[dy, dx]
+    else:
+        co, ci = kernel.shape[:2]
+        assert ci == c
+        o, n, yo, xo, dy, dx = np.meshgrid(np.arange(co), np.arange(ci),
+                                           np.arange(ho), np.arange(wo),
+                                           np.arange(kh), np.arange(kw),
+                                           indexing='ij')
+        weight = kernel[o, n, dy, dx]
+    y = yo*stride + dy - kh//2
+    x = xo*stride + dx - kw//2
+    keep = (x >= 0) & (x < w) & (y >= 0) & (y < h) & (weight != 0)
+    i = n[keep]*w*h + y[keep]*w + x[keep]
+    j = o[keep]*wo*ho + yo[keep]*wo + xo[keep]
+    return i, j, weight[keep], (wo, ho, co)
+
+def dog_kernel(size:int, sigma_center:float, sigma_surround:float,
+               wcenter:float, wsurround:float):
+    """Difference-of-Gaussians kernel: wcenter*Gc + wsurround*Gs, where Gc 
+    and Gs are Gaussians of standard deviations sigma_center and 
+    sigma_surround (in pixels) summing to 1 over the kernel
+
+    Args:
+        size (int): Width and height of the kernel (odd)
+        sigma_center (float): Standard deviation of the center Gaussian
+        sigma_surround (float): Standard deviation of the surround Gaussian
+        wcenter (float): Total weight of the center
+        wsurround (float): Total weight of the surround
+
+    Returns:
+        np.ndarray: (size, size) kernel
+    """
+    r = np.arange(size) - size//2
+    r2 = r[:, None]**2 + r[None, :]**2
+    gc = np.exp(-r2/(2*sigma_center**2))
+    gs = np.exp(-r2/(2*sigma_surround**2))
+    return wcenter*gc/gc.sum() + wsurround*gs/gs.sum()
+
+def Addconvolution(net:b2.Network, a:str, b:str, kernel:np.ndarray,
+                   in_shape:tuple=None, stride:int=1):
+    """Add 2D convolutional synapses from population a to b, as a single
+    brian2.Synapses with one weight per synapse (see conv_connectivity)
+
+    Args:
+        net (b2.Network): The brian2.Network containing the two populations, 
+                          and to which we add the synapses
+        a (str): Name of the projecting population
+        b (str): Name of the receiving population
+        kernel (np.ndarray): Weights in mV, see conv_connectivity
+        in_shape (tuple, optional): (width, height) or (width, height, 
+                                    channels) of population a. Defaults to
+                                    None, i.e. a square single channel.
+        stride (int, optional): Stride of the convolution. Defaults to 1.
+
+    Returns:
+        tuple: (width, height, channels) of population b
+    """
+    A = net[a]
+    B = net[b]
+    if in_shape is None:
+        sN = int(np.sqrt(A.N))
+        in_shape = (sN, sN)
+    i, j, w, out_shape = conv_connectivity(in_shape, kernel, stride)
+    assert B.N == np.prod(out_shape)
+    s = b2.Synapses(A, B, 'w_syn : volt', on_pre='vm+=w_syn',
+                    name='s_%s_%s' % (a, b))
+    s.connect(i=i, j=j)
+    s.w_syn = w*b2.mV
+    net.add(s)
+    return out_shape
+
+def Addconverge(net:b2.Network, a:str, b:str, centerw:float, surroundw:float,
+                in_shape:tuple=None):
     """Add 2D converging synapses from population a to b, with two weights:
     one for the central one-to-one synapses, and one for the surround 
     synapses. Think LGN->V1 or convolutions with 2 weights.
@@ -17,33 +123,17 @@ def Addconverge(net:b2.Network, a:str, b:str, centerw:float, surroundw:float):
         b (str): Name of the receiving populations
         centerw (float): Weight of the center connections
         surroundw (float): Weight of the surround connections
+        in_shape (tuple, optional): (width, height) or (width, height,
+                                    channels) of the populations. Defaults
+                                    to None, i.e. square.
     """
-    
-    A = net[a]
-    B = net[b]
-    center = b2.Synapses(A, B, on_pre='vm+=%s*mV'%centerw)
-    surround = b2.Synapses(A, B, on_pre='vm+=%s*mV'%surroundw)
-    center.connect('i==j')
-    net.add(center)
-    N = A.N
-    sN = int(np.sqrt(N))
-    k = np.arange(N).reshape(sN, sN)
-    u, ku = k[1:,:]-sN, k[1:,:]
-    d, kd = k[:sN-1,:]+sN, k[:sN-1,:] 
-    r, kr = k[:,:sN-1]+1, k[:,:sN-1]
-    l, kl = k[:,1:]-1, k[:,1:]
-    ur, kur = k[1:, :sN-1]-sN+1, k[1:, :sN-1]
-    ul, kul = k[1:, 1:]-sN-1, k[1:, 1:]
-    dr, kdr = k[:sN-1, :sN-1]+sN+1, k[:sN-1, :sN-1]
-    dl, kdl = k[:sN-1, 1:]+sN-1, k[:sN-1, 1:]
-    i = np.concatenate([s.flatten() for s in [ku, kd, kr, kl, kur,
-                                              kul, kdr, kdl]])
-    j = np.concatenate([s.flatten() for s in [u, d, r, l, ur, ul, dr, dl]])
-    surround.connect(i=i, j=j)
-    net.add(surround)
+    kernel = np.full((3, 3), float(surroundw))
+    kernel[1, 1] = centerw
+    Addconvolution(net, a, b, kernel, in_shape)
     
 def AddOnCenterOffSuroundRetina(net:b2.Network, a:str, w:tuple=(12,-4),
-                                name:str='retina'):
+                                name:str='retina', in_shape:tuple=None,
+                                dog:tuple=None, size:int=5):
     """Add a population receiving on-center off-surround local converging
     afference from population a. If a is pixel-space, then this population
     models the activity of retinal ganglion cells (or LGN cells)
@@ -57,10 +147,24 @@ def AddOnCenterOffSuroundRetina(net:b2.Network, a:str, w:tuple=(12,-4),
                              Defaults to (12,-4).
         name (str, optional): Name of the receiving population. Defaults to
                               'retina'.
+        in_shape (tuple, optional): (width, height) or (width, height,
+                                    channels) of population a. Defaults to
+                                    None, i.e. square.
+        dog (tuple, optional): (sigma_center, sigma_surround). If given, the
+                               afference is a size x size 
+                               difference-of-Gaussians kernel of total 
+                               center and surround weights w (see 
+                               dog_kernel) instead of the 3x3 center and 
+                               surround weights. Defaults to None.
+        size (int, optional): Size of the difference-of-Gaussians kernel.
+                              Defaults to 5.
     """
     
     S = net[a]
     retina = neurons(S.N, name=name)
     net.add(retina)
-    Addconverge(net, a, name, w[0], w[1])
-    
\ No newline at end of file
+    if dog is None:
+        Addconverge(net, a, name, w[0], w[1], in_shape)
+    else:
+        Addconvolution(net, a, name, dog_kernel(size, dog[0], dog[1], w[0],
+                                                w[1]), in_shape)
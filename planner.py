@@ -0,0 +1,317 @@
+import brian2 as b2
+import inspect
+import numpy as np
+import warnings
+
+from types import SimpleNamespace
+
+from connectivity import union
+from modules import Area, connect, lateral_pairs
+
+# Size in bytes of the arrays of each type: 'f' floating point (see
+# neuron_model.set_precision), 'i' 32 bits integers, 'b' booleans
+sizes = {'i': 4, 'b': 1}
+
+# Bytes per recorded spike of a brian2.SpikeMonitor (int32 index, float64
+# time) and of a recording.SpikeRecorder file (int32 index, float32 time)
+spike_bytes = {'memory': 12, 'disk': 8}
+
+
+class Plan:
+    """Dry run of a network built with Area and connect: records the
+    populations, synapses and monitors that Area and connect would create,
+    from the same arguments, without allocating them (weight matrices are
+    only used to count synapses), and predicts neuron and synapse counts,
+    bytes per variable, monitor growth and synaptic events, e.g.
+
+    plan = Plan()
+    plan.area(1000, 'LOW', None, -25, 12, IRPoisson=True, recordspikes=True)
+    plan.area(500, 'HIGH', None, -25, 12, IRPoisson=True, onlyIR=True)
+    plan.connect('HIGH', 'LOW', W, 12, plastic=True)
+    plan.check(8*2**30, duration=100*b2.second)
+    """
+
+    def __init__(self):
+        self.areas = dict()
+        self.groups = dict()
+        self.synapses = dict()
+        self.monitors = dict()
+
+    def _group(self, name:str, n:int, variables:dict, spikes:str=None):
+        # variables: {name: (number of values, type)}, spikes: name of the
+        # population whose rate sets the number of stored spikes
+        self.groups[name] = {'n': n, 'variables': variables,
+                             'spikes': spikes}
+
+    def _adex(self, name:str, n:int, method:str, params:str,
+              heterogeneous:tuple=()):
+        variables = {'vm': (n, 'f'), 'w': (n, 'f'), 'I': (n, 'f'),
+                     'i': (n, 'i'), '_spikespace': (n+1, 'i')}
+        for param in ('tauw', 'a', 'b', 'Vr', 'taum'):
+            if params == 'neuron' or param in heterogeneous:
+                variables[param] = (n, 'f')
+            elif params == 'shared':
+                variables[param] = (1, 'f')
+        if method == 'exponential_euler':
+            variables['Iexp'] = (n, 'f')
+        self._group(name, n, variables)
+
+    def _synapses(self, source:str, target:str, count:int,
+                  variables:tuple=(), shared:tuple=(), post:bool=False,
+                  namesup:str=''):
+        name = 's_%s_%s' % (source, target) \
+               + ('_%s' % namesup if namesup else '')
+        spec = {'_synaptic_pre': (count, 'i'), '_synaptic_post': (count, 'i'),
+                'N_incoming': (count, 'i'), 'N_outgoing': (count, 'i')}
+        spec.update({var: (count, 'f') for var in variables})
+        spec.update({var: (1, 'f') for var in shared})
+        self.synapses[name] = {'source': source, 'target': target,
+                               'count': count, 'variables': spec,
+                               'post': post}
+
+    def area(self, *args, **kwargs):
+        """Plan an Area, with the arguments of Area (net can be None)
+
+        Returns:
+            types.SimpleNamespace: The arguments of the area
+        """
+        bound = inspect.signature(Area.__init__).bind(None, *args, **kwargs)
+        bound.apply_defaults()
+        a = SimpleNamespace(**bound.arguments)
+        del a.self
+        if a.name in self.areas:
+            raise ValueError('Area name %s is used twice' % a.name)
+        self.areas[a.name] = a
+        name, N, M = a.name, a.N, a.N*a.batch
+        free = not (a.IRPoisson or a.IRSet)
+
+        # Populations
+        if a.fused:
+            layout = ([('IR', 'ir')] if free else []) + [('interIR', 'i')]
+            if not a.onlyIR:
+                layout += [('NPE', 'pe'), ('interNPE', 'i'), ('PPE', 'pe'),
+                           ('interPPE', 'i')]
+            mixed = len(set(behavior for _, behavior in layout)) > 1
+            self._adex(name+'_neurons', M*len(layout), a.method, a.params,
+                       ('tauw', 'taum') if mixed else ())
+        if a.IRPoisson and a.IRgenerator:
+            self._group(name+'_IR', M, {'neuron_index': (0, 'i'),
+                                        'spike_time': (0, 'f')},
+                        spikes=name+'_IR')
+        elif a.IRPoisson:
+            self._group(name+'_IR', M, {'rates': (M, 'f'),
+                                        'lastspike': (M, 'f'),
+                                        'not_refractory': (M, 'b'),
+                                        'i': (M, 'i'),
+                                        '_spikespace': (M+1, 'i')})
+        elif a.IRSet:
+            self._group(name+'_IR', M, {'neuron_index': (0, 'i'),
+                                        'spike_time': (0, 'f')})
+        elif not a.fused:
+            self._adex(name+'_IR', M, a.method, a.params)
+        roles = ['interIR'] + ([] if a.onlyIR else ['NPE', 'interNPE', 'PPE',
+                                                    'interPPE'])
+        if not a.fused:
+            for role in roles:
+                self._adex(name+'_'+role, M, a.method, a.params)
+
+        # Synapses, as in Area
+        def pair(p1, p2, w):
+            if a.skipzero and w == 0:
+                return
+            self._synapses(name+'_'+p1, name+'_'+p2, M,
+                           shared=('w_syn',) if a.onetoone else (),
+                           variables=() if a.onetoone else ('w_syn',))
+        if free:
+            pair('interIR', 'IR', a.wINHIIR)
+            if not a.lateralplasticity:
+                pair('IR', 'IR', a.wmax)
+            else:
+                if a.lateral is None:
+                    count = a.batch*N*(N-1)
+                elif np.isscalar(a.lateral):
+                    count = a.batch*N*int(a.lateral)
+                else:
+                    count = len(lateral_pairs(N, a.batch, a.lateral)[0])
+                self._synapses(name+'_IR', name+'_IR', count,
+                               ('w_syn', 'apre', 'apost', 'lastupdate'),
+                               ('wmax', 'thetaSTDP'), post=True)
+        if a.tointerneurons:
+            pair('IR', 'interIR', a.wmax)
+        if not a.onlyIR:
+            if a.tointerneurons:
+                pair('PPE', 'interPPE', a.wmax)
+            pair('interNPE', 'NPE', a.wINHIPE)
+            pair('interPPE', 'PPE', a.wINHIPE)
+            pair('IR', 'interNPE', a.wmax)
+            pair('IR', 'PPE', a.wEXCIPE)
+            if free:
+                pair('NPE', 'IR', a.wEXCIIR)
+                pair('PPE', 'interIR', a.wmax)
+
+        # Monitors and initial spikes
+        if a.recordspikes:
+            for role in ['IR'] + ([] if a.onlyIR else ['NPE', 'PPE']):
+                self.monitors[name+'_'+role+'_RECORD'] = {
+                    'source': name+'_'+role,
+                    'kind': 'disk' if a.spikepath is not None else 'memory'}
+        if a.SetSpikes:
+            k = len(a.SetSpikes)
+            self._group(name+'_INITSG', k, {'neuron_index': (k, 'i'),
+                                            'spike_time': (k, 'f')})
+            self._synapses(name+'_INITSG', name+'_IR', k*a.batch, ('w_syn',))
+        return a
+
+    def connect(self, *args, **kwargs):
+        """Plan a connect, with the arguments of connect, where the areas
+        can be given by name
+        """
+        bound = inspect.signature(connect).bind(*args, **kwargs)
+        bound.apply_defaults()
+        c = SimpleNamespace(**bound.arguments)
+        a1 = self.areas[c.a1] if isinstance(c.a1, str) else c.a1
+        a2 = self.areas[c.a2] if isinstance(c.a2, str) else c.a2
+        assert a1.batch == a2.batch
+        assert c.W.shape == (a1.N, a2.N)
+
+        # Number of prediction synapses, as prediction_pairs: nonzero
+        # weights, or every pair (all-to-all) when plastic without mask
+        if c.pairs is not None:
+            count = len(c.pairs[0])
+        elif not c.plastic:
+            count = c.W.count_nonzero() if hasattr(c.W, 'count_nonzero') \
+                    else np.count_nonzero(c.W)
+        elif c.mask is None:
+            count = a1.N*a2.N
+        else:
+            count = len(union(c.W.shape, c.W, c.mask)[0])
+        count *= a1.batch
+        linkbool = not c.onlyPPE and not c.onlyNPE and c.plastic
+        def skip(w):
+            return c.skipzero and not c.plastic and w == 0
+        def plastic(variables):
+            if c.gated and 'Wf' in variables:
+                variables += ('enabled',)
+            return variables if c.plastic else ('w_syn',)
+        shared = ('w_syn', 'lr', 'twindow') if c.plastic else ()
+        free = not (a1.IRPoisson or a1.IRSet)
+        if not c.onlyPPE:
+            if not skip(c.wEXCIPE):
+                self._synapses(a1.name+'_IR', a2.name+'_NPE', count,
+                               plastic(('lastpre', 'lastpost', 'Wf')),
+                               shared, post=c.plastic)
+            if free and not skip(c.wmax):
+                self._synapses(a2.name+'_NPE', a1.name+'_interIR', count,
+                               plastic(()),
+                               ('w_syn',) if c.plastic else ())
+        if not c.onlyNPE:
+            if not skip(c.wmax):
+                self._synapses(a1.name+'_IR', a2.name+'_interPPE', count,
+                               plastic(('lastpre', 'lastpost')
+                                       + (() if linkbool else ('Wf',))),
+                               shared, post=c.plastic)
+            if free and not skip(c.wEXCIIR):
+                self._synapses(a2.name+'_PPE', a1.name+'_IR', count,
+                               plastic(()),
+                               ('w_syn',) if c.plastic else ())
+
+    def report(self, rates:(float, dict)=10., duration:b2.Quantity=None):
+        """Predicted size and cost of the planned network
+
+        Args:
+            rates (float, dict, optional): Firing rate (in Hz) of every
+                                           population, or a dict of rates
+                                           indexed by population name (e.g.
+                                           'LOW_NPE') or role (e.g. 'NPE'),
+                                           missing populations having a rate
+                                           of 0. Defaults to 10.
+            duration (b2.Quantity, optional): Duration of the simulation,
+                                              which sets the size of the
+                                              Poisson spikes drawn in
+                                              advance and of the recorded
+                                              spikes. Defaults to None, i.e.
+                                              neither is counted.
+
+        Returns:
+            dict: 'neurons' and 'synapses' counts, 'bytes' of all variables
+                  (including spikes drawn in advance and recorded spikes
+                  held in memory), 'variables': bytes of each variable
+                  indexed by object name and variable name,
+                  'monitor_bytes_per_second' and 'disk_bytes_per_second'
+                  growth of the recordings and 'events_per_second' (spikes
+                  times synapses of every synaptic pathway)
+        """
+        size = dict(sizes, f=np.dtype(b2.prefs.core.default_float_dtype)
+                             .itemsize)
+        seconds = 0. if duration is None else float(duration/b2.second)
+        def rate(population):
+            if np.isscalar(rates):
+                return float(rates)
+            return float(rates.get(population,
+                                   rates.get(population.rsplit('_', 1)[-1],
+                                             0.)))
+        n = {name: g['n'] for name, g in self.groups.items()}
+        for area in self.areas.values():
+            if area.fused:
+                for role in ('IR', 'interIR', 'NPE', 'interNPE', 'PPE',
+                             'interPPE'):
+                    n.setdefault(area.name+'_'+role, area.N*area.batch)
+
+        variables = dict()
+        for name, g in list(self.groups.items()) + \
+                       list(self.synapses.items()):
+            variables[name] = {var: count*size[kind] for var, (count, kind)
+                               in g['variables'].items()}
+            if g.get('spikes'):
+                spikes = rate(g['spikes'])*g['n']*seconds
+                variables[name]['neuron_index'] = spikes*size['i']
+                variables[name]['spike_time'] = spikes*size['f']
+        growth = {'memory': 0., 'disk': 0.}
+        for name, m in self.monitors.items():
+            growth[m['kind']] += rate(m['source'])*n[m['source']] \
+                                 *spike_bytes[m['kind']]
+            if m['kind'] == 'memory':
+                variables[name] = {'i': rate(m['source'])*n[m['source']]
+                                        *seconds*4,
+                                   't': rate(m['source'])*n[m['source']]
+                                        *seconds*8}
+        events = sum(s['count']*(rate(s['source'])
+                                 + (rate(s['target']) if s['post'] else 0.))
+                     for s in self.synapses.values())
+        return {'neurons': sum(g['n'] for g in self.groups.values()),
+                'synapses': sum(s['count'] for s in self.synapses.values()),
+                'bytes': sum(sum(v.values()) for v in variables.values()),
+                'variables': variables,
+                'monitor_bytes_per_second': growth['memory'],
+                'disk_bytes_per_second': growth['disk'],
+                'events_per_second': events}
+
+    def check(self, budget:float, rates:(float, dict)=10.,
+              duration:b2.Quantity=None, warn:float=.8):
+        """Refuse a planned network that would not fit in a memory budget
+
+        Args:
+            budget (float): Memory budget in bytes
+            rates (float, dict, optional): See report. Defaults to 10.
+            duration (b2.Quantity, optional): See report. Defaults to None.
+            warn (float, optional): Fraction of the budget above which a
+                                    warning is issued. Defaults to .8.
+
+        Returns:
+            dict: The report, see report
+
+        Raises:
+            MemoryError: If the predicted memory exceeds the budget
+        """
+        report = self.report(rates, duration)
+        largest = max(((sum(v.values()), name) for name, v
+                       in report['variables'].items()), default=(0, ''))
+        message = 'Planned network needs %.3g GB (budget %.3g GB), ' \
+                  'largest object %s (%.3g GB)' \
+                  % (report['bytes']/2**30, budget/2**30, largest[1],
+                     largest[0]/2**30)
+        if report['bytes'] > budget:
+            raise MemoryError(message)
+        if report['bytes'] > warn*budget:
+            warnings.warn(message)
+        return report
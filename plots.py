@@ -6,14 +6,20 @@ def raster_plot(M:b2.SpikeMonitor, marker:str=',', T:tuple=None):
     """Raster plot of a brian2.SpikeMonitor
 
     Args:
-        M (b2.SpikeMonitor): Recording of spikes.
+        M (b2.SpikeMonitor): Recording of spikes. A recording.SpikeFile is
+                             also accepted, and only the spikes in T are
+                             then read.
         marker (str; optional): The marker to use in the plot. Defaults to str.
         T (tuple, optional): (tmin, tmax) to plot.
     Returns:
         list of plt.Line2D: The raster plot
     """
     
-    pl, = b2.plot(M.t/b2.ms, M.i, marker)
+    if T is not None and hasattr(M, 'window'):
+        i, t = M.window(T[0]*b2.ms, T[1]*b2.ms)
+    else:
+        i, t = M.i, M.t
+    pl, = b2.plot(t/b2.ms, i, marker)
     plt.gca().set(title=M.name)
     if T is not None:
         plt.gca().set(xlim=(T[0], T[1]))
@@ -24,7 +30,7 @@ def rateplot2d(M:b2.SpikeMonitor, from_:float, to:float, wh:tuple):
     activity in a spiking population processing 2D data such as images.
 
     Args:
-        M (b2.SpikeMonitor): Recording of spikes
+        M (b2.SpikeMonitor): Recording of spikes, or recording.SpikeFile
         from_ (float): Time when we start taking spikes into account
         to (float): Time when we stop taking spikes into account
         wh (tuple): (width, height) of the data. w*h must be nb of neurons
@@ -32,7 +38,10 @@ def rateplot2d(M:b2.SpikeMonitor, from_:float, to:float, wh:tuple):
     Returns:
         plt.AxesImage: The 2D rate plot
     """
-    im1 = M.i[np.where(np.logical_and(from_<M.t/b2.ms, M.t/b2.ms<to))[0]]
+    if hasattr(M, 'window'):
+        im1 = M.window(from_*b2.ms, to*b2.ms)[0]
+    else:
+        im1 = M.i[np.where(np.logical_and(from_<M.t/b2.ms, M.t/b2.ms<to))[0]]
     m = np.max(im1)
     idx = np.concatenate([np.bincount(im1), np.zeros(wh[0]*wh[1]-m-1)])
     idx = idx.reshape(wh[0],wh[1])
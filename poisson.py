@@ -0,0 +1,76 @@
+import numpy as np
+
+
+def poisson_spikes(rates:np.ndarray, window:float, refractory:float=0.,
+                   rng:np.random.Generator=None):
+    """Draw Poisson spike trains of piecewise constant rates, only for the
+    neurons with a nonzero rate. This replaces a threshold 'rand()<rates*dt'
+    (one random number per neuron and time step) by a few random numbers per
+    spike, for a brian2.SpikeGeneratorGroup.
+
+    Args:
+        rates (np.ndarray): (windows, N) firing rates in Hz, window k
+                            spanning [k*window, (k+1)*window[
+        window (float): Duration of each window in seconds
+        refractory (float, optional): Refractory period in seconds:
+                                      interspike intervals are refractory +
+                                      an exponential interval, whose rate 
+                                      rates/(1-rates*refractory) is 
+                                      corrected for the dead time so that
+                                      the mean rate is rates. The dead time
+                                      of the last spike of a window carries
+                                      over to the following ones. Defaults
+                                      to 0.
+        rng (np.random.Generator, optional): Random generator. Defaults to
+                                             None, i.e. the global numpy
+                                             generator (seeded by b2.seed).
+
+    Returns:
+        np.ndarray: neuron indices
+        np.ndarray: spike times in seconds, sorted
+
+    Raises:
+        ValueError: If a rate is not below 1/refractory
+    """
+    rng = np.random if rng is None else rng
+    rates = np.atleast_2d(rates)
+    if np.any(rates*refractory >= 1):
+        raise ValueError('Rates must be below 1/refractory = %g Hz'
+                         % (1/refractory))
+    indices, times = list(), list()
+
+    # End of the dead time of the last spike of each neuron
+    free = np.full(rates.shape[1], -np.inf)
+    for k, r in enumerate(rates):
+        active = np.flatnonzero(r > 0)
+        if len(active) == 0:
+            continue
+        r = r[active]/(1 - r[active]*refractory)
+
+        # Enough intervals for (almost) all neurons to reach the end of the
+        # window, then more for the few that do not. The first spike of a
+        # neuron is an exponential interval after the start of the window
+        # or the end of its dead time, whichever is later.
+        expected = np.max(r)*window
+        last = np.maximum(free[active] - k*window, 0.) - refractory
+        t = np.zeros((len(active), 0))
+        while np.any(last < window):
+            n = int(expected + 5*np.sqrt(expected) + 10)
+            isi = rng.exponential(1/r[:, None], (len(active), n)) + refractory
+            t = np.hstack([t, last[:, None] + np.cumsum(isi, axis=1)])
+            last = t[:, -1]
+        keep = t < window
+        indices.append(np.broadcast_to(active[:, None], t.shape)[keep])
+        times.append(k*window + t[keep])
+
+        # Spike times increase along each row, so the kept spikes of a
+        # neuron come first
+        count = keep.sum(axis=1)
+        spiked = count > 0
+        free[active[spiked]] = k*window + refractory \
+                               + t[spiked, count[spiked]-1]
+    if not indices:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    indices, times = np.concatenate(indices), np.concatenate(times)
+    order = np.argsort(times, kind='stable')
+    return indices[order], times[order]
@@ -0,0 +1,180 @@
+import brian2 as b2
+import json
+import numpy as np
+
+from sweeps import role
+
+
+def area_of(group:b2.Group):
+    """Name of the area of a population built by Area
+
+    Args:
+        group (b2.Group): The population
+
+    Returns:
+        str: The area name, i.e. the name of the population without its role
+    """
+    return group.name.rsplit('_', 1)[0]
+
+def kind(obj:b2.BrianObject):
+    """Area and kind of an object of a network built with Area and connect:
+    the role of a population ('IR', 'NPE', 'interPPE', ..., 'neurons' for
+    fused populations), 'input' for Poisson or predefined internal
+    representations, 'prediction synapses' (between areas), 'lateral
+    synapses' (lateral STDP), 'local synapses', 'monitor' or 'profiler'
+
+    Args:
+        obj (b2.BrianObject): The object
+
+    Returns:
+        str: The area name (the area of the target for synapses)
+        str: The kind
+    """
+    if obj.name.endswith('_PROFILE'):
+        return area_of(obj.source), 'profiler'
+    if isinstance(obj, (b2.SpikeMonitor, b2.StateMonitor,
+                        b2.PopulationRateMonitor)):
+        return area_of(obj.source), 'monitor'
+    if isinstance(obj, b2.Synapses):
+        area = area_of(obj.target)
+        if 'Wf' in obj.variables or area_of(obj.source) != area:
+            return area, 'prediction synapses'
+        if 'thetaSTDP' in obj.variables:
+            return area, 'lateral synapses'
+        return area, 'local synapses'
+    if isinstance(obj, b2.SpikeGeneratorGroup) \
+       or 'rates' in getattr(obj, 'variables', ()):
+        return area_of(obj), 'input'
+    return area_of(obj), role(obj)
+
+class Profiler:
+    """Instrumentation of a network built with Area and connect: runs it
+    with brian2 profiling, maps the time of each code object (state
+    updates, thresholds, resets, synaptic pathways, monitors, ...) back to
+    the area and kind (see kind) of the object owning it, and counts the
+    spikes of every population and the synaptic events of every synapses.
+    The spikes are counted by SpikeMonitor named after the population +
+    '_PROFILE' that do not record spike times, whose cost appears as the
+    'profiler' kind. Works with the runtime and cpp_standalone devices.
+
+    Args:
+        net (b2.Network): The network, fully built
+    """
+
+    def __init__(self, net:b2.Network):
+        self.net = net
+        self.times = dict()
+        self.duration = 0*b2.second
+        self.counters = dict()
+        for obj in list(net.objects):
+            if isinstance(obj, (b2.NeuronGroup, b2.Subgroup,
+                                b2.SpikeGeneratorGroup)):
+                self.counters[obj.name] = b2.SpikeMonitor(
+                    obj, record=False, name=obj.name+'_PROFILE')
+                net.add(self.counters[obj.name])
+
+    def run(self, duration:b2.Quantity, **kwargs):
+        """Run the network with profiling, accumulating the times of
+        successive runs
+
+        Args:
+            duration (b2.Quantity): Duration of the run
+            **kwargs: Other arguments of brian2.Network.run
+        """
+        self.net.run(duration, profile=True, **kwargs)
+        for name, t in self.net.profiling_info:
+            self.times[name] = self.times.get(name, 0.) + float(t/b2.second)
+        self.duration += duration
+
+    def owner(self, codeobj:str):
+        """Object of the network owning a code object, i.e. the object
+        with the longest name that is the name of the code object or
+        followed by '_' in it (monitors name their code object after
+        themselves, groups add '_stateupdater', '_spike_thresholder', ...)
+
+        Args:
+            codeobj (str): Name of the code object
+
+        Returns:
+            b2.BrianObject: The owner, or None if not found
+        """
+        found = [obj for obj in self.net.objects
+                 if codeobj == obj.name or codeobj.startswith(obj.name+'_')]
+        return max(found, key=lambda obj: len(obj.name), default=None)
+
+    def report(self):
+        """Machine-readable report of the runs so far
+
+        Returns:
+            dict: 'duration' (in s) and 'steps' of the runs, 'codeobjects':
+                  list of dicts with the name, area, kind and time (in s) of
+                  each code object, and 'areas': for each area and kind, a
+                  dict with the time (in s) spent in its code objects, the
+                  spikes per time step (populations and inputs) and the
+                  synaptic events (presynaptic and postsynaptic spikes
+                  times synapses) per time step (synapses)
+        """
+        steps = int(round(float(self.duration/b2.defaultclock.dt)))
+        areas, codeobjects = dict(), list()
+        def entry(area, k):
+            return areas.setdefault(area, dict()).setdefault(
+                k, {'time': 0., 'spikes': 0., 'events': 0.})
+        for name, t in sorted(self.times.items(), key=lambda item: -item[1]):
+            obj = self.owner(name)
+            area, k = kind(obj) if obj is not None else ('', 'other')
+            codeobjects.append({'name': name, 'area': area, 'kind': k,
+                                'time': t})
+            entry(area, k)['time'] += t
+
+        # Spikes of the populations, and events of the pathways of the
+        # synapses (spikes of their source or target times their number of
+        # synapses)
+        for obj in self.net.objects:
+            if obj.name in self.counters:
+                if obj.name.endswith('_neurons'):
+                    continue
+                count = self.counters[obj.name].count[:]
+                entry(*kind(obj))['spikes'] += np.sum(count) / max(steps, 1)
+            elif isinstance(obj, b2.Synapses):
+                for pathway in obj._pathways:
+                    group, index = (obj.source, obj.i) \
+                                   if pathway.prepost == 'pre' \
+                                   else (obj.target, obj.j)
+                    if group.name not in self.counters:
+                        continue
+                    count = self.counters[group.name].count[:]
+                    synapses = np.bincount(index[:], minlength=len(group))
+                    entry(*kind(obj))['events'] += \
+                        float(synapses @ count) / max(steps, 1)
+        return {'duration': float(self.duration/b2.second), 'steps': steps,
+                'codeobjects': codeobjects, 'areas': areas}
+
+    def save(self, path:str):
+        """Write the report (see report) to a JSON file
+
+        Args:
+            path (str): The file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+    def table(self):
+        """Per-area breakdown of the runs so far, as text
+
+        Returns:
+            str: One line per area and kind, with the time spent and its
+                 fraction of the total, the spikes and the synaptic events
+                 per time step
+        """
+        report = self.report()
+        total = max(sum(c['time'] for c in report['codeobjects']), 1e-12)
+        lines = ['%-12s %-20s %10s %6s %12s %12s'
+                 % ('area', 'kind', 'time (s)', '%', 'spikes/step',
+                    'events/step')]
+        for area, kinds in sorted(report['areas'].items()):
+            for k, e in sorted(kinds.items(), key=lambda item:
+                               -item[1]['time']):
+                lines.append('%-12s %-20s %10.3f %6.1f %12.3f %12.3f'
+                             % (area, k, e['time'], 100*e['time']/total,
+                                e['spikes'], e['events']))
+        return '\n'.join(lines)
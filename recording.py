@@ -0,0 +1,181 @@
+import brian2 as b2
+import numpy as np
+import os
+
+
+class SpikeRecorder:
+    """Record the spikes of a population to disk instead of memory. Spikes
+    are collected by a brian2.SpikeMonitor, which is emptied every chunk of
+    simulated time by appending its content to two raw files: path+'_i.bin'
+    (neuron indices, int32) and path+'_t.bin' (spike times in seconds,
+    float32). Memory is thus bounded by the spikes of one chunk. Since
+    flushing is done by a brian2.network_operation, this needs the runtime
+    device.
+
+    Args:
+        group (b2.Group): The population to record
+        path (str): Prefix of the files. Existing files are overwritten.
+        name (str): Name of the brian2.SpikeMonitor
+        net (b2.Network): brian2.Network in which to add the monitor
+        chunk (b2.Quantity, optional): Simulated time between two flushes.
+                                       Defaults to 1 second.
+    """
+
+    def __init__(self, group:b2.Group, path:str, name:str, net:b2.Network,
+                 chunk:b2.Quantity=1*b2.second):
+        self.path = path
+        self.N = len(group)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        for suffix in ('_i.bin', '_t.bin'):
+            open(path+suffix, 'wb').close()
+        self.monitor = b2.SpikeMonitor(group, name=name)
+        self.operation = b2.NetworkOperation(self.flush, dt=chunk, when='end',
+                                             name=name+'_flush')
+        net.add(self.monitor, self.operation)
+
+    def flush(self):
+        """Append the spikes held by the monitor to the files and empty it
+        """
+        i = np.asarray(self.monitor.i[:], dtype=np.int32)
+        t = np.asarray(self.monitor.t[:]/b2.second, dtype=np.float32)
+        with open(self.path+'_i.bin', 'ab') as f:
+            f.write(i.tobytes())
+        with open(self.path+'_t.bin', 'ab') as f:
+            f.write(t.tobytes())
+        self.monitor.resize(0)
+        self.monitor.variables['N'].set_value(0)
+
+    def reader(self):
+        """Flush the monitor and open the recorded spikes
+
+        Returns:
+            SpikeFile: The recorded spikes
+        """
+        self.flush()
+        return SpikeFile(self.path, self.N, name=self.monitor.name)
+
+
+class SpikeFile:
+    """Lazy reader of the spikes written by SpikeRecorder. The files are
+    memory-mapped, so that only the spikes that are used are read. Has the
+    i, t, count and name attributes of a brian2.SpikeMonitor, and window
+    returns the spikes of a time interval without reading the others.
+
+    Args:
+        path (str): Prefix of the files
+        N (int): Number of neurons of the recorded population
+        name (str, optional): Name, e.g. for plot titles. Defaults to None,
+                              i.e. the file name.
+    """
+
+    def __init__(self, path:str, N:int, name:str=None):
+        self.path = path
+        self.N = N
+        self.name = os.path.basename(path) if name is None else name
+
+    def _memmap(self, suffix:str, dtype:type):
+        if os.path.getsize(self.path+suffix) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.path+suffix, dtype=dtype, mode='r')
+
+    @property
+    def i(self):
+        return self._memmap('_i.bin', np.int32)
+
+    @property
+    def t(self):
+        return self._memmap('_t.bin', np.float32)*b2.second
+
+    @property
+    def count(self):
+        return np.bincount(self._memmap('_i.bin', np.int32),
+                           minlength=self.N)
+
+    def window(self, tmin:b2.Quantity, tmax:b2.Quantity):
+        """Spikes in the time interval [tmin, tmax[. Spikes are written in
+        time order, so the interval is found by binary search.
+
+        Args:
+            tmin (b2.Quantity): Start of the interval
+            tmax (b2.Quantity): End of the interval
+
+        Returns:
+            np.ndarray: Neuron indices
+            b2.Quantity: Spike times
+        """
+        t = self._memmap('_t.bin', np.float32)
+        a, b = np.searchsorted(t, [float(tmin/b2.second),
+                                   float(tmax/b2.second)])
+        return np.array(self.i[a:b]), np.array(t[a:b])*b2.second
+
+
+class StateRecorder:
+    """Record variables of a population in single precision. Values are 
+    collected by a brian2.StateMonitor, which is emptied every chunk of 
+    simulated time by converting its content to float32 arrays, so that the
+    float64 recording never holds more than one chunk. Has the t and 
+    variable attributes of a brian2.StateMonitor (with the trailing 
+    underscore versions for values without units). Since emptying is done
+    by a brian2.network_operation, this needs the runtime device.
+
+    Args:
+        group (b2.Group): The population to record
+        variables (list): Names of the variables to record
+        record (bool, list, np.ndarray): Neurons to record, see 
+                                         brian2.StateMonitor
+        name (str): Name of the brian2.StateMonitor
+        net (b2.Network): brian2.Network in which to add the monitor
+        dt (b2.Quantity, optional): Recording interval. Defaults to None, 
+                                    i.e. every time step.
+        chunk (b2.Quantity, optional): Simulated time between two flushes.
+                                       Defaults to 1 second.
+    """
+
+    def __init__(self, group:b2.Group, variables:list,
+                 record:(bool, list, np.ndarray), name:str, net:b2.Network,
+                 dt:b2.Quantity=None, chunk:b2.Quantity=1*b2.second):
+        self.variables = list(variables)
+        self.name = name
+        self.monitor = b2.StateMonitor(group, self.variables, record=record,
+                                       dt=dt, name=name)
+        self.operation = b2.NetworkOperation(self.flush, dt=chunk, when='end',
+                                             name=name+'_flush')
+        self.units = {v: b2.get_unit(group.variables[v].dim)
+                      for v in self.variables}
+        self.chunks = {v: list() for v in self.variables + ['t']}
+        net.add(self.monitor, self.operation)
+
+    def flush(self):
+        """Convert the values held by the monitor to float32 and empty it
+        """
+        self.chunks['t'].append(np.asarray(self.monitor.t_[:], np.float32))
+        for v in self.variables:
+            self.chunks[v].append(np.asarray(getattr(self.monitor, v+'_'),
+                                             np.float32))
+        self.monitor.resize(0)
+        self.monitor.variables['N'].set_value(0)
+
+    def reader(self):
+        """Flush the monitor, and merge the recorded chunks
+
+        Returns:
+            StateRecorder: The recorder itself
+        """
+        self.flush()
+        for key, chunks in self.chunks.items():
+            axis = 0 if key == 't' else 1
+            self.chunks[key] = [np.concatenate(chunks, axis=axis)]
+        return self
+
+    def __getattr__(self, key:str):
+        if key in ('chunks', 'units'):
+            raise AttributeError(key)
+        if key.endswith('_') and key[:-1] in self.chunks:
+            return self.chunks[key[:-1]][0]
+        if key == 't':
+            return self.chunks['t'][0]*b2.second
+        if key in self.units:
+            return self.chunks[key][0]*self.units[key]
+        raise AttributeError(key)
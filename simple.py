@@ -5,7 +5,7 @@ import matplotlib.pyplot as plt
 
 from neuron_model import C, gL, EL, VT, DeltaT, Vcut
 from neuron_model import taupre, taupost, Apre, Apost
-from neuron_model import neurons, synapses
+from neuron_model import neurons, synapses, model_namespace
 from plots import rplots
 from modules import Area, connect 
 
@@ -18,6 +18,99 @@ def exp1():
     # We take advantage of the brian2genn interface to run simulations on GPU
     b2.set_device('genn')
     
+    # We create a brian2.Network to hold component of our simulation, and
+    # build the network of the experiment in it (see build1)
+    net = b2.Network()
+    namespace = dict(model_namespace, **build1(net))
+    
+    # Running simulation
+    net.run(4*b2.second, namespace=namespace)
+    
+    # Raster plots
+    rplots(net['LOW_IR_RECORD'], net['HIGH_IR_RECORD'], 
+           net['LOW_NPE_RECORD'], net['LOW_PPE_RECORD'], marker='.')
+    plt.show()
+
+def exp2():
+    """
+    Experiment 2: Bottom-Up inference
+    """
+    
+    b2.set_device('genn')
+    net = b2.Network()
+    namespace = dict(model_namespace, **build2(net))
+    net.run(4*b2.second, namespace=namespace)
+    rplots(net['LOW_IR_RECORD'], net['HIGH_IR_RECORD'], 
+           net['LOW_NPE_RECORD'], net['LOW_PPE_RECORD'], marker='.')
+    plt.show()
+
+def exp3():
+    """
+    Experiment 3: Top-Down inference
+    """
+    
+    b2.set_device('genn')
+    net = b2.Network()
+    namespace = dict(model_namespace, **build3(net))
+    net.run(4*b2.second, namespace=namespace)
+    rplots(net['LOW_IR_RECORD'], net['HIGH_IR_RECORD'], 
+           net['LOW_NPE_RECORD'], net['LOW_PPE_RECORD'], marker='.')
+    plt.show()
+
+def exp4():
+    """
+    Experiment 4: Learning temporal sequences with STDP
+    """
+    
+    net = b2.Network()
+    build4(net)
+    net.run(2.2*b2.second)
+    rplots(net['LOW_IR_RECORD'], net['HIGH_IR_RECORD'], 
+           net['LOW_PPE_RECORD'], marker='.', T=(0, 2200))
+    plt.show()
+
+def exp5():
+    """
+    Experiment 5: Learning prediction weights
+    """
+    
+    net = b2.Network()
+    namespace = dict(model_namespace, **build5(net))
+    Wf = net['s_HIGH_IR_LOW_NPE'].Wf.variable.get_value()
+    print('Before learning:\n%s' % (Wf.reshape(2,3)>.5).astype(int))
+    
+    net.run(20*b2.second, namespace=namespace)
+    
+    Wf = net['s_HIGH_IR_LOW_NPE'].Wf.variable.get_value()
+    print('After learning:\n%s' % (Wf.reshape(2,3)>.5).astype(int))
+    
+    rplots(net['LOW_IR_RECORD'], net['HIGH_IR_RECORD'], 
+           net['LOW_NPE_RECORD'], net['LOW_PPE_RECORD'], marker=',', 
+           T=(0, 20000))
+    plt.show()
+    
+def sweep1():
+    """
+    Sweep of experiment 1 over the weights of synapses to PE populations,
+    with the network compiled only once
+    """
+    
+    from sweeps import CompiledSweep
+    sweep = CompiledSweep(build1, 4*b2.second)
+    points = [{'wINHIPE': wINHIPE, 'wEXCIPE': wEXCIPE}
+              for wINHIPE in (-35, -25, -15) for wEXCIPE in (8, 12, 16)]
+    for point, results in zip(points, sweep.sweep(points)):
+        print(point, 'NPE spikes: %d, PPE spikes: %d' 
+              % (results['LOW_NPE_RECORD'].sum(),
+                 results['LOW_PPE_RECORD'].sum()))
+    
+def build1(net, **kwargs):
+    """
+    Network of experiment 1, also used for sweeps and validations. Keyword 
+    arguments are passed to every Area. Returns the brian2.TimedArray of
+    rates by name, for the namespace of the run
+    """
+    
     # brian2.TimedArray representing the firing rates of internal
     # representation populations when we decide to set their activity 
     # to predifined Poisson spike trains 
@@ -26,9 +119,6 @@ def exp1():
     timedRatesLOW = b2.TimedArray(65*activationLOW*b2.Hz, dt=1*b2.second)
     timedRatesHIGH = b2.TimedArray(65*activationHIGH*b2.Hz, dt=1*b2.second)
     
-    # We create a brian2.Network to hold component of our simulation
-    net = b2.Network()
-    
     # Model parameters: weights of prediction synapses
     wINHIPE, wEXCIPE = -25, 12
     
@@ -44,13 +134,13 @@ def exp1():
     # higher area, and both areas have predigined Poisson spike trains
     # as internal representations
     LOW = Area(3, 'LOW', net, wINHIPE, wEXCIPE, IRPoisson=True,
-               recordspikes=True)
+               recordspikes=True, **kwargs)
     HIGH = Area(2, 'HIGH', net, wINHIPE, wEXCIPE, IRPoisson=True,
-                onlyIR=True, recordspikes=True)
+                onlyIR=True, recordspikes=True, **kwargs)
     
     # Setting firing rates of Poisson internal representations
-    LOW.set_rates('timedRatesLOW')
-    HIGH.set_rates('timedRatesHIGH') 
+    LOW.set_rates('timedRatesLOW', timedRatesLOW)
+    HIGH.set_rates('timedRatesHIGH', timedRatesHIGH) 
     # putting the var names as arguments of set_rates can seem a little off
     # putting and not really scalable to larger projects, but it's simply a 
     # workaround because b2genn does not support b2.TimedArray as model 
@@ -59,63 +149,53 @@ def exp1():
     # Connecting the two areas. HIGH sends predictions to LOW, and LOW sends
     # back prediction errors to HIGH
     connect(HIGH, LOW, W, wEXCIPE, plastic=False)
-    
-    # Running simulation
-    net.run(4*b2.second)
-    
-    # Raster plots
-    rplots(LOW['IR'], HIGH['IR'], LOW['NPE'], LOW['PPE'], marker='.')
-    plt.show()
+    return {'timedRatesLOW': timedRatesLOW, 'timedRatesHIGH': timedRatesHIGH}
 
-def exp2():
+def build2(net, **kwargs):
     """
-    Experiment 2: Bottom-Up inference
+    Network of experiment 2, also used for sweeps and validations. Keyword 
+    arguments are passed to every Area
     """
     
-    b2.set_device('genn')
     activationLOW = np.array([[1, 0, 1], [0, 1, 1], [1, 0, 1], [0, 1, 1]])
     timedRatesLOW = b2.TimedArray(65*activationLOW*b2.Hz, dt=1*b2.second)
-    net = b2.Network()
     wINHIPE, wEXCIPE = -25, 12
     wINHIIR, wEXCIIR = -20, 25
     W = np.array([[1, 0, 1], 
                   [0, 1, 1]])
     LOW = Area(3, 'LOW', net, wINHIPE, wEXCIPE, IRPoisson=True,
-               recordspikes=True)
+               recordspikes=True, **kwargs)
     HIGH = Area(2, 'HIGH', net, wINHIPE, wEXCIPE, wINHIIR, wEXCIIR,
-                onlyIR=True, recordspikes=True)
-    LOW.set_rates('timedRatesLOW')
+                onlyIR=True, recordspikes=True, **kwargs)
+    LOW.set_rates('timedRatesLOW', timedRatesLOW)
     connect(HIGH, LOW, W, wEXCIPE, wEXCIIR, plastic=False)
-    net.run(4*b2.second)
-    rplots(LOW['IR'], HIGH['IR'], LOW['NPE'], LOW['PPE'], marker='.')
-    plt.show()
+    return {'timedRatesLOW': timedRatesLOW}
 
-def exp3():
+def build3(net, **kwargs):
     """
-    Experiment 3: Top-Down inference
+    Network of experiment 3, also used for sweeps and validations. Keyword 
+    arguments are passed to every Area
     """
     
-    b2.set_device('genn')
     activationHIGH = np.array([[1, 0], [0, 1], [1, 0], [0, 1]])
     timedRatesHIGH = b2.TimedArray(65*activationHIGH*b2.Hz, dt=1*b2.second)
-    net = b2.Network()
     wINHIPE, wEXCIPE = -20, 12
     wINHIIR, wEXCIIR = -20, 25
     W = np.array([[1, 0, 1], 
                   [0, 1, 1]])
     LOW = Area(3, 'LOW', net, wINHIPE, wEXCIPE, wINHIIR, wEXCIIR,
-               recordspikes=True)
+               recordspikes=True, **kwargs)
     HIGH = Area(2, 'HIGH', net, wINHIPE, wEXCIPE, IRPoisson=True, onlyIR=True,
-                recordspikes=True)
-    HIGH.set_rates('timedRatesHIGH')
+                recordspikes=True, **kwargs)
+    HIGH.set_rates('timedRatesHIGH', timedRatesHIGH)
     connect(HIGH, LOW, W, wEXCIPE, wEXCIIR, plastic=False)
-    net.run(4*b2.second)
-    rplots(LOW['IR'], HIGH['IR'], LOW['NPE'], LOW['PPE'], marker='.')
-    plt.show()
+    return {'timedRatesHIGH': timedRatesHIGH}
 
-def exp4():
+def build4(net, **kwargs):
     """
-    Experiment 4: Learning temporal sequences with STDP
+    Network of experiment 4, also used for validations. The change of 
+    learning phase at 1.6 s is a brian2.NetworkOperation (runtime device 
+    only). Keyword arguments are passed to every Area
     """
     
     indices = np.tile(np.array([0, 2, 1, 3, 2, 4, 3, 5]), 25)
@@ -123,19 +203,19 @@ def exp4():
     times += 80*np.repeat(np.arange(0,25), 8)
     times[-40:] += 200
     times = times * b2.ms
-    net = b2.Network()
     wINHIPE, wEXCIPE = -30, 35
     wINHIIR, wEXCIIR = -20, 20
     W = np.array([[1, 0, 1, 0, 0, 0], 
                   [0, 1, 0, 1, 0, 0],
                   [0, 0, 1, 0, 1, 0],
                   [0, 0, 0, 1, 0, 1]])
-    LOW = Area(6, 'LOW', net, wINHIPE, wEXCIPE, IRSet=True, recordspikes=True)
+    LOW = Area(6, 'LOW', net, wINHIPE, wEXCIPE, IRSet=True, recordspikes=True,
+               **kwargs)
     
     # Higher area has lateral plasticity
     HIGH = Area(4, 'HIGH', net, wINHIPE, wEXCIPE, wINHIIR, wEXCIIR,
                 onlyIR=True, lateralplasticity=True, recordspikes=True, 
-                SetSpikes = [(0,1.8)])
+                SetSpikes = [(0,1.8)], **kwargs)
     
     LOW.set_spikes(indices, times)
     connect(HIGH, LOW, W, wEXCIPE, wEXCIIR, plastic=False, onlyPPE=True)
@@ -145,17 +225,17 @@ def exp4():
     # networks are capricious beasts
     net['s_HIGH_IR_LOW_interPPE'].w_syn = 0*b2.mV
     net['s_HIGH_IR_HIGH_IR'].thetaSTDP = 40*b2.mV
-    net.run(1.6*b2.second)
-    net['s_HIGH_IR_LOW_interPPE'].w_syn = 35*b2.mV
-    net['s_HIGH_IR_HIGH_IR'].thetaSTDP = 7*b2.mV
-    net.run(.6*b2.second)
-    
-    rplots(LOW['IR'], HIGH['IR'], LOW['PPE'], marker='.', T=(0, 2200))
-    plt.show()
+    def phase(t):
+        if t >= 1.6*b2.second:
+            net['s_HIGH_IR_LOW_interPPE'].w_syn = 35*b2.mV
+            net['s_HIGH_IR_HIGH_IR'].thetaSTDP = 7*b2.mV
+    net.add(b2.NetworkOperation(phase, dt=1.6*b2.second))
 
-def exp5():
+def build5(net, wINHIPE=-35, wEXCIPE=12, lr=(.045, .01), twindow=(2, 20),
+           wmax=35., **kwargs):
     """
-    Experiment 5: Learning prediction weights
+    Network of experiment 5, also used for parameter sweeps and validations.
+    Other keyword arguments are passed to every Area
     """
     
     activationLOW = np.tile(np.array([[1, 0, 1], [0, 1, 1], 
@@ -163,31 +243,92 @@ def exp5():
     activationHIGH = np.tile(np.array([[1, 0], [0, 1], [1, 0], [0, 1]]), (5,1))
     timedRatesLOW = b2.TimedArray(65*activationLOW*b2.Hz, dt=1*b2.second)
     timedRatesHIGH = b2.TimedArray(65*activationHIGH*b2.Hz, dt=1*b2.second)
-    net = b2.Network()
-    wINHIPE, wEXCIPE = -35, 12
     
     # W = (np.random.random(size=(2, 3)) > 0.5).astype(np.int)
     W = np.array([[0,0,1], [1,0,1]])
-    print('Before learning:\n%s' % W)
     
     LOW = Area(3, 'LOW', net, wINHIPE, wEXCIPE, IRPoisson=True,
-               recordspikes=True, tointerneurons=True)
+               recordspikes=True, tointerneurons=True, wmax=wmax, **kwargs)
     HIGH = Area(2, 'HIGH', net, wINHIPE, wEXCIPE, IRPoisson=True,
-                onlyIR=True, recordspikes=True, tointerneurons=True)
-    LOW.set_rates('timedRatesLOW')
-    HIGH.set_rates('timedRatesHIGH') 
+                onlyIR=True, recordspikes=True, tointerneurons=True, wmax=wmax,
+                **kwargs)
+    LOW.set_rates('timedRatesLOW', timedRatesLOW)
+    HIGH.set_rates('timedRatesHIGH', timedRatesHIGH) 
     
     # Prediction weights are plastic
-    connect(HIGH, LOW, W, wEXCIPE, plastic=True)
+    connect(HIGH, LOW, W, wEXCIPE, plastic=True, wmax=wmax, lr=lr,
+            twindow=twindow)
+    return {'timedRatesLOW': timedRatesLOW, 'timedRatesHIGH': timedRatesHIGH}
+
+def sweep5():
+    """
+    Sweep of experiment 5 over the weights of synapses to PE populations and
+    the learning rate, on all CPU cores
+    """
     
-    net.run(20*b2.second)
+    from sweeps import grid, grid_sweep
+    points = grid(wINHIPE=[-45, -35, -25], wEXCIPE=[8, 12, 16],
+                  lr=[(.045, .01), (.09, .02)])
+    results = grid_sweep(build5, points, 20*b2.second)
+    for k, point in enumerate(points):
+        print(point, 'NPE rate: %.2f Hz, PPE rate: %.2f Hz, learned W:\n%s'
+              % (results['LOW_NPE_RECORD_rate'][k],
+                 results['LOW_PPE_RECORD_rate'][k],
+                 (results['s_HIGH_IR_LOW_NPE_Wf'][k].reshape(2,3)>.5)
+                 .astype(int)))
     
-    Wf = net['s_HIGH_IR_LOW_NPE'].Wf.variable.get_value()
-    print('After learning:\n%s' % (Wf.reshape(2,3)>.5).astype(np.int))
+def validate_integration(method='rk2', dt=.5*b2.ms):
+    """
+    Error of an integration method at a larger time step against the Euler 
+    method at a small time step: on isolated populations of each behavior, 
+    where spike times can be compared, and on experiments 1, 2, 3 and 5 
+    (experiment 4 changes weights between runs), where the delayed lateral
+    loops decorrelate spike times so that only rates can be compared
+    """
     
-    rplots(LOW['IR'], HIGH['IR'], LOW['NPE'], LOW['PPE'], marker=',', 
-           T=(0, 20000))
-    plt.show()
+    from validation import validate, validate_neurons
+    for results in (validate_neurons(method, dt),
+                    validate({'exp1': (build1, 4*b2.second),
+                              'exp2': (build2, 4*b2.second),
+                              'exp3': (build3, 4*b2.second),
+                              'exp5': (build5, 20*b2.second)}, method, dt)):
+        for name, result in results.items():
+            print('%s: agreement %.3f, spike count error %.3f, '
+                  'rate error %.3f' % (name, result['agreement'], 
+                                       result['count_error'],
+                                       result['rate_error']))
+    
+def check_precision():
+    """
+    Regression check of single precision against double precision on 
+    experiments 1 to 5: spike statistics and learned prediction weights
+    """
+    
+    from validation import validate_precision
+    results = validate_precision({'exp1': (build1, 4*b2.second),
+                                  'exp2': (build2, 4*b2.second),
+                                  'exp3': (build3, 4*b2.second),
+                                  'exp4': (build4, 2.2*b2.second),
+                                  'exp5': (build5, 20*b2.second)})
+    bound = results.pop('bound')
+    for name, result in results.items():
+        print(name, ', '.join('%s %s' % item for item in result.items()))
+    print('Worst: %s' % bound)
+    assert bound['same_learned'], 'learned W differs in single precision'
+    
+def calibrate_meanfield():
+    """
+    Mean rates of the recorded populations of experiments 1, 2, 3 and 5 
+    with the rate-based surrogate and with spiking simulations
+    """
+    
+    from meanfield import calibrate
+    results = calibrate({'exp1': (build1, 4*b2.second),
+                         'exp2': (build2, 4*b2.second),
+                         'exp3': (build3, 4*b2.second),
+                         'exp5': (build5, 20*b2.second)})
+    for name, result in results.items():
+        print(name, ', '.join('%s %.3f' % item for item in result.items()))
     
 
 if __name__ == "__main__":
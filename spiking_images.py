@@ -1,13 +1,132 @@
 import brian2 as b2 
-import PIL 
+import PIL.Image
+import PIL.ImageEnhance
+import hashlib
+import multiprocessing
 import os
 import sys
 import numpy as np 
 import pickle
 
+from neuron_model import model_namespace
+from poisson import poisson_spikes
+
+def _image_files(imgfolder:str):
+    """Names of the image files in imgfolder, in the order of os.listdir
+    (as PoissonImages has always read them)
+
+    Args:
+        imgfolder (str): location of images
+
+    Returns:
+        list of str: The file names
+    """
+    return [f for f in os.listdir(sys.path[0]+imgfolder)
+            if f.endswith(".jpg") or f.endswith(".png")
+            or f.endswith(".jpeg")]
+
+def _decode(args:tuple):
+    """Decode and preprocess one image
+
+    Args:
+        args (tuple): (path, resize, contrast_multiplier, imgmode), see 
+                      PoissonImages
+
+    Returns:
+        np.ndarray: flatten pixel values
+    """
+    path, resize, contrast_multiplier, imgmode = args
+    im = PIL.Image.open(path)
+    im = im.convert(imgmode)
+    if resize is not None:
+        im = im.resize(resize)
+    if contrast_multiplier != 1:
+        enhancer = PIL.ImageEnhance.Contrast(im)
+        im = enhancer.enhance(contrast_multiplier)
+    return np.array(im).flatten()
+
+def preprocessed_images(imgfolder:str, resize:tuple=None,
+                        contrast_multiplier:float=1, imgmode:str='L',
+                        value_to_rate_coeff:float=0.25, cache_dir:str=None,
+                        processes:int=None):
+    """Firing rates of the images in imgfolder (see PoissonImages), read 
+    from a persistent cache. The cache file is keyed by the folder, the
+    names, sizes and modification times of the images and by the 
+    preprocessing parameters, and is rebuilt by decoding the images on a 
+    pool of processes when any of them changed.
+
+    Args:
+        imgfolder (str): location of images
+        resize (tuple, optional): See PoissonImages. Defaults to None.
+        contrast_multiplier (float, optional): See PoissonImages. Defaults
+                                               to 1.
+        imgmode (str, optional): See PoissonImages. Defaults to grayscale.
+        value_to_rate_coeff (float, optional): See PoissonImages. Defaults
+                                               to 0.25.
+        cache_dir (str, optional): Directory of the cache files. Defaults to
+                                   None, i.e. ~/.cache/SpikingPredNet, so
+                                   that nothing is written in imgfolder.
+        processes (int, optional): Number of processes decoding images.
+                                   Defaults to None, i.e. the number of CPU
+                                   cores.
+
+    Returns:
+        np.ndarray: Firing rates in Hz, one image per row
+    """
+    folder = sys.path[0]+imgfolder
+    filenames = _image_files(imgfolder)
+    stats = [os.stat(os.path.join(folder, f)) for f in filenames]
+    key = hashlib.sha1(repr((os.path.abspath(folder),
+                             [(f, st.st_size, st.st_mtime_ns)
+                              for f, st in zip(filenames, stats)],
+                             resize, contrast_multiplier, imgmode,
+                             value_to_rate_coeff)).encode()).hexdigest()
+    cache_dir = os.path.join(os.path.expanduser('~'), '.cache',
+                             'SpikingPredNet') if cache_dir is None \
+                else cache_dir
+    path = os.path.join(cache_dir, key+'.npy')
+    if os.path.exists(path):
+        return np.load(path)
+    
+    with multiprocessing.Pool(processes) as pool:
+        arrays = pool.map(_decode, [(os.path.join(folder, f), resize,
+                                     contrast_multiplier, imgmode)
+                                    for f in filenames])
+    rates = np.vstack(arrays) * value_to_rate_coeff
+    
+    # Written under a temporary name and renamed, so that concurrent 
+    # launches never read a partial file
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = '%s.%d.tmp.npy' % (path[:-4], os.getpid())
+    np.save(tmp, rates)
+    os.replace(tmp, path)
+    return rates
+
+def _spike_generator(rates:np.ndarray, presentation_time:float,
+                     name:str=None):
+    """brian2.SpikeGeneratorGroup playing Poisson spike trains drawn in 
+    advance, only for nonzero rates (see poisson.poisson_spikes). Spikes of
+    a neuron are at least one time step apart, as with a threshold 
+    'rand()<rates*dt'.
+
+    Args:
+        rates (np.ndarray): (images, N) firing rates in Hz
+        presentation_time (float): presentation time of each image in ms
+        name (str, optional): Name of the group. Defaults to None.
+
+    Returns:
+        brian2.SpikeGeneratorGroup: The Poisson population
+    """
+    indices, times = poisson_spikes(rates, presentation_time/1000.,
+                                    float(b2.defaultclock.dt/b2.second))
+    kwargs = dict() if name is None else {'name': name}
+    return b2.SpikeGeneratorGroup(rates.shape[1], indices, times*b2.second,
+                                  **kwargs)
+
 def PoissonImages(imgfolder:str, presentation_time:float,
                   resize:tuple=None, contrast_multiplier:float=1,
-                  imgmode:str='L',value_to_rate_coeff:float=0.25):
+                  imgmode:str='L',value_to_rate_coeff:float=0.25,
+                  cache:bool=False, generator:bool=False):
     """Load each images in imgfolder onto a Poisson neural population, 
     changing image every presentation_time ms
 
@@ -25,6 +144,14 @@ def PoissonImages(imgfolder:str, presentation_time:float,
         value_to_rate_coeff (float, optional): coeff to pass from pixel value 
                                                (0->255) to Poisson firing rate. 
                                                Defaults to 0.25.
+        cache (bool, optional): If True then firing rates are read from the
+                                cache of preprocessed_images (written on
+                                first use), else images are decoded again.
+                                Defaults to False.
+        generator (bool, optional): If True then the population is a 
+                                    brian2.SpikeGeneratorGroup playing spikes
+                                    drawn in advance for nonzero rates only.
+                                    Defaults to False.
 
     Returns:
         brian2.TimedArray: A TimedArray of firing rates representing images
@@ -32,31 +159,26 @@ def PoissonImages(imgfolder:str, presentation_time:float,
                             firing rates
     """
     
-    arrays = list()
-    for filename in os.listdir(sys.path[0]+imgfolder):
-        if filename.endswith(".jpg") or filename.endswith(".png") \
-         or filename.endswith(".jpeg"):
-            im = PIL.Image.open(os.path.join(sys.path[0]+imgfolder, filename))
-            im = im.convert(imgmode)
-            if resize is not None:
-                im = im.resize(resize)
-            if contrast_multiplier != 1:
-                enhancer = PIL.ImageEnhance.Contrast(im)
-                im = enhancer.enhance(contrast_multiplier)
-            arrays.append(np.array(im).flatten())
-        else:
-            continue
-    values = np.vstack(arrays)
-    images = b2.TimedArray(values*b2.Hz*value_to_rate_coeff,
-                           presentation_time*b2.ms)
-    N = len(values[0])
+    if cache:
+        rates = preprocessed_images(imgfolder, resize, contrast_multiplier,
+                                    imgmode, value_to_rate_coeff)
+    else:
+        rates = np.vstack([_decode((os.path.join(sys.path[0]+imgfolder, f),
+                                    resize, contrast_multiplier, imgmode))
+                           for f in _image_files(imgfolder)]) \
+                * value_to_rate_coeff
+    images = b2.TimedArray(rates*b2.Hz, presentation_time*b2.ms)
+    N = len(rates[0])
+    if generator:
+        return images, _spike_generator(rates, presentation_time)
     group = b2.NeuronGroup(N, 'rates : Hz', threshold='rand()<rates*dt')
     group.run_regularly('rates = images(t,i)', presentation_time*b2.ms)
     return images, group
     
 def PoissonMNIST(presentation_time:float=1000, N:int=60000, resize:tuple=None,
                  contrast_multiplier:float=1, imgmode:str=None,
-                 value_to_rate_coeff:float=0.25, name:str='PoissonMNIST'):
+                 value_to_rate_coeff:float=0.25, name:str='PoissonMNIST',
+                 generator:bool=False):
     """Load MNIST dataset onto a Poisson neural population changing image
     every presentation_time. Necessit of pickled file containing mnist_imgs the
     flatten pixel values of MNIST digits and mnist_labels the MNIST labels
@@ -80,6 +202,11 @@ def PoissonMNIST(presentation_time:float=1000, N:int=60000, resize:tuple=None,
                                                Defaults to 0.25.
         name (str, optional): Name of the neural population. Defaults to 
                               'PoissonMNIST'.
+        generator (bool, optional): If True then the population is a 
+                                    brian2.SpikeGeneratorGroup playing spikes
+                                    drawn in advance for nonzero rates only
+                                    (all N images at once, see PoissonStream
+                                    for long runs). Defaults to False.
 
     Returns:
         brian2.TimedArray: A TimedArray of firing rates representing MNIST
@@ -99,7 +226,171 @@ def PoissonMNIST(presentation_time:float=1000, N:int=60000, resize:tuple=None,
     timed_spikes = b2.TimedArray(value_to_rate_coeff*mnist_imgs*b2.Hz,
                                  presentation_time*b2.ms)
     M = len(mnist_imgs[0])
+    if generator:
+        group = _spike_generator(value_to_rate_coeff*mnist_imgs,
+                                 presentation_time, name=name)
+        return timed_spikes, group, mnist_labels, N*presentation_time*b2.ms
     group = b2.NeuronGroup(M, 'rates : Hz', threshold='rand()<rates*dt',
                            name=name)
     group.run_regularly('rates = images(t,i)', presentation_time*b2.ms) 
-    return timed_spikes, group, mnist_labels, N * presentation_time*b2.ms
\ No newline at end of file
+    return timed_spikes, group, mnist_labels, N * presentation_time*b2.ms
+
+def images_to_npy(imgfolder:str, path:str, resize:tuple=None,
+                  contrast_multiplier:float=1, imgmode:str='L'):
+    """Decode each image in imgfolder once and store the flatten pixel values
+    in a .npy file, written row by row so that the whole dataset is never
+    held in memory. The file can then be memory-mapped by PoissonStream.
+
+    Args:
+        imgfolder (str): location of images
+        path (str): .npy file to write
+        resize (tuple, optional): Image size. If None no resize is performed.
+                                  Defaults to None.
+        contrast_multiplier (float, optional): Controls contrast of images. >1 
+                                               is higher contrast. Defaults to 
+                                               1.
+        imgmode (str, optional): Color encoding, passed to PIL.Image.convert.
+                                 Defaults to grayscale.
+
+    Returns:
+        str: path
+
+    Raises:
+        ValueError: If imgfolder contains no image
+    """
+    folder = sys.path[0]+imgfolder
+    filenames = _image_files(imgfolder)
+    if not filenames:
+        raise ValueError('No .jpg, .png or .jpeg image in %s' % folder)
+    values = None
+    for k, filename in enumerate(filenames):
+        pixels = _decode((os.path.join(folder, filename), resize,
+                          contrast_multiplier, imgmode))
+        if values is None:
+            values = np.lib.format.open_memmap(path, mode='w+',
+                                               dtype=pixels.dtype,
+                                               shape=(len(filenames),
+                                                      len(pixels)))
+        values[k] = pixels
+    values.flush()
+    return path
+
+def mnist_to_npy(path:str):
+    """Convert the pickled MNIST file used by PoissonMNIST into two .npy
+    files, path+'_imgs.npy' and path+'_labels.npy', that can be 
+    memory-mapped by PoissonStream
+
+    Args:
+        path (str): Prefix of the .npy files
+
+    Returns:
+        str: Path of the images file
+        str: Path of the labels file
+    """
+    f = open(sys.path[0]+"/mnist", "rb")
+    mnist_imgs = pickle.load(f)
+    mnist_labels = pickle.load(f)
+    f.close()
+    np.save(path+'_imgs.npy', np.asarray(mnist_imgs))
+    np.save(path+'_labels.npy', np.asarray(mnist_labels))
+    return path+'_imgs.npy', path+'_labels.npy'
+
+
+class PoissonStream:
+    """Poisson neural population presenting the images of a memory-mapped
+    .npy file (see images_to_npy and mnist_to_npy), changing image every
+    presentation_time ms. Instead of one brian2.TimedArray holding the whole
+    dataset, the network is run in segments of chunk images, and the
+    firing rates of each segment are read from the file into a new
+    TimedArray just before it, so that memory does not grow with the number
+    of presented images. Since every segment is a separate run, this is 
+    meant for the runtime device.
+
+    Args:
+        path (str): .npy file of flatten pixel values, one image per row
+        presentation_time (float): presentation time of each image in ms
+        chunk (int, optional): Number of images per segment. Defaults to
+                               1000.
+        value_to_rate_coeff (float, optional): coeff to pass from pixel value 
+                                               (0->255) to Poisson firing rate. 
+                                               Defaults to 0.25.
+        shuffle (bool, optional): If True then images are presented in a 
+                                  random order. Defaults to False.
+        name (str, optional): Name of the neural population. Defaults to 
+                              'PoissonStream'.
+        generator (bool, optional): If True then the population is a 
+                                    brian2.SpikeGeneratorGroup, whose spikes
+                                    are drawn for nonzero rates only before
+                                    each segment. Defaults to False.
+        net (b2.Network, optional): brian2.Network in which to add the
+                                    population. Defaults to None.
+    """
+    
+    def __init__(self, path:str, presentation_time:float, chunk:int=1000,
+                 value_to_rate_coeff:float=0.25, shuffle:bool=False,
+                 name:str='PoissonStream', net:b2.Network=None,
+                 generator:bool=False):
+        self.values = np.load(path, mmap_mode='r')
+        self.presentation_time = presentation_time
+        self.chunk = chunk
+        self.value_to_rate_coeff = value_to_rate_coeff
+        self.order = np.random.permutation(len(self.values)) if shuffle \
+                     else np.arange(len(self.values))
+        self.buffer_name = name+'_rates'
+        self.generator = generator
+        if generator:
+            self.group = b2.SpikeGeneratorGroup(self.values.shape[1], [],
+                                                []*b2.ms, name=name)
+        else:
+            self.group = b2.NeuronGroup(self.values.shape[1],
+                '''rates : Hz
+                   t_start : second (shared)''',
+                threshold='rand()<rates*dt', name=name)
+            self.group.run_regularly('rates = %s(t-t_start,i)' 
+                                     % self.buffer_name,
+                                     presentation_time*b2.ms)
+        if net is not None:
+            net.add(self.group)
+    
+    def run(self, net:b2.Network, N:int=None, start:int=0,
+            namespace:dict=None, **kwargs):
+        """Present N images, starting from image start, by running net in
+        segments of chunk images
+
+        Args:
+            net (b2.Network): brian2.Network containing the population
+            N (int, optional): Number of images to present. Defaults to None,
+                               i.e. all images from start.
+            start (int, optional): Index of the first image (in presentation
+                                   order). Defaults to 0.
+            namespace (dict, optional): Namespace of the runs, which must
+                                        hold every external name used by
+                                        the network (see brian2.Network.run).
+                                        Defaults to None, i.e. the parameters
+                                        of neuron_model.
+            Any other keyword argument is passed to brian2.Network.run
+
+        Returns:
+            np.ndarray: Indices (rows of the .npy file) of the presented
+                        images
+        """
+        stop = len(self.order) if N is None else min(len(self.order),
+                                                     start+N)
+        for a in range(start, stop, self.chunk):
+            b = min(stop, a+self.chunk)
+            values = np.asarray(self.values[self.order[a:b]])
+            run_namespace = dict(namespace or model_namespace)
+            if self.generator:
+                indices, times = poisson_spikes(
+                    self.value_to_rate_coeff*values,
+                    self.presentation_time/1000.,
+                    float(b2.defaultclock.dt/b2.second))
+                self.group.set_spikes(indices, times*b2.second + net.t)
+            else:
+                run_namespace[self.buffer_name] = b2.TimedArray(
+                    self.value_to_rate_coeff*values*b2.Hz,
+                    self.presentation_time*b2.ms)
+                self.group.t_start = net.t
+            net.run((b-a)*self.presentation_time*b2.ms,
+                    namespace=run_namespace, **kwargs)
+        return self.order[start:stop]
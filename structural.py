@@ -0,0 +1,143 @@
+import brian2 as b2
+import numpy as np
+
+from connectivity import pairs
+from modules import Area, connect
+
+
+class StructuralPlasticity:
+    """Prediction weight learning between two Area (connect with
+    plastic=True) on a fixed budget of synapses: every interval, the
+    synapses whose learned weight Wf has stayed below floor for patience
+    consecutive checks are removed, and as many new candidate pairs are
+    sampled with weight w_init. brian2 cannot add or remove synapses
+    during a simulation, so the prediction synapses are built once for every
+    candidate pair, gated (see connect): only budget of them are enabled,
+    the others have Wf = 0 and neither learn nor transmit, and a step only
+    changes enabled and Wf. Memory and spike propagation therefore scale
+    with the number of candidate pairs (use mask to bound it), learning and
+    transmission with the budget. Runtime device only, since weights are
+    read between runs.
+
+    Args:
+        a1 (Area): The higher area
+        a2 (Area): The lower area
+        W (np.ndarray): Initial prediction weight matrix, or scipy.sparse
+                        matrix. Its nonzero entries are candidate pairs, and
+                        the initial synapses (the largest ones if there are 
+                        more than budget), completed with random candidates.
+        wEXCIPE (float): Weight of synapses exciting lower PE populations
+        budget (int): Number of enabled prediction synapses
+        floor (float, optional): Weight below which a synapse is a candidate
+                                 for removal. Defaults to .1.
+        patience (int, optional): Number of consecutive checks below floor
+                                  before removal. Defaults to 3.
+        interval (b2.Quantity, optional): Time between checks. Defaults to
+                                          1 s.
+        w_init (float, optional): Initial weight of new synapses, which do
+                                  not transmit until it exceeds .5. Defaults
+                                  to .5.
+        mask (np.ndarray, tuple, optional): Candidate pairs (see
+                                            connectivity.pairs). Defaults to
+                                            None, i.e. all pairs.
+        **kwargs: Other arguments of connect (wEXCIIR, onlyPPE, lr, ...)
+    """
+
+    def __init__(self, a1:Area, a2:Area, W:np.ndarray, wEXCIPE:float,
+                 budget:int, floor:float=.1, patience:int=3,
+                 interval:b2.Quantity=1*b2.second, w_init:float=.5,
+                 mask:(np.ndarray, tuple)=None, **kwargs):
+        import scipy.sparse
+        assert a1.batch == 1 and a2.batch == 1
+        assert w_init >= floor
+        self.a1, self.a2 = a1, a2
+        self.net = a1.net
+        self.budget = budget
+        self.floor = floor
+        self.patience = patience
+        self.interval = interval
+        self.w_init = w_init
+        self.shape = (a1.N, a2.N)
+        self.rng = np.random.default_rng(np.random.randint(2**31))
+        self.pruned = list()
+
+        # Candidate pairs (flat indices, sorted as the synapses built by
+        # connect): mask or all pairs, and the nonzero weights of W
+        i, j = W.nonzero()
+        w = np.asarray(W[i, j], dtype=float).ravel()
+        initial = np.ravel_multi_index((i, j), self.shape)
+        candidates = np.arange(self.shape[0]*self.shape[1]) if mask is None \
+                     else np.ravel_multi_index(pairs(mask, self.shape),
+                                               self.shape)
+        self.keys = np.union1d(candidates, initial)
+
+        # Initial synapses: largest nonzero weights, then random candidates
+        order = np.argsort(-w, kind='stable')[:budget]
+        Wf = np.zeros(len(self.keys))
+        Wf[np.searchsorted(self.keys, initial[order])] = w[order]
+        self.enabled = Wf > 0
+        Wf[self._sample(budget - np.sum(self.enabled), self.enabled)] = w_init
+        self.enabled = Wf > 0
+        self.below = np.zeros(len(self.keys), dtype=int)
+        i, j = np.unravel_index(self.keys, self.shape)
+        connect(a1, a2, scipy.sparse.csr_matrix((Wf, (i, j)),
+                                                shape=self.shape),
+                wEXCIPE, plastic=True, pairs=(i, j), gated=True, **kwargs)
+        self._owner().enabled = self.enabled.astype(float)
+
+    def _owner(self):
+        """Forward synapses holding Wf and enabled (see
+        modules.prediction_weights)"""
+        h, l = self.a1.name, self.a2.name
+        name, other = 's_%s_IR_%s_NPE' % (h, l), 's_%s_IR_%s_interPPE' % (h, l)
+        return self.net[name if name in self.net else other]
+
+    def _sample(self, n:int, excluded:np.ndarray):
+        """Sample n synapses (indices in keys) among the ones not excluded
+        (boolean array)"""
+        free = np.flatnonzero(~excluded)
+        return self.rng.choice(free, min(max(n, 0), len(free)),
+                               replace=False)
+
+    def step(self):
+        """Check the weights, disable the synapses that stayed below 
+        floor and enable new ones
+
+        Returns:
+            int: Number of removed synapses
+        """
+        owner = self._owner()
+        Wf = np.asarray(owner.Wf.variable.get_value())
+        self.below = np.where(self.enabled & (Wf < self.floor),
+                              self.below + 1, 0)
+        removed = self.below >= self.patience
+        self.pruned.append(int(np.sum(removed)))
+        if not np.any(removed):
+            return 0
+
+        # The removed synapses cannot be sampled again at once
+        self.enabled &= ~removed
+        self.below[removed] = 0
+        Wf[removed] = 0
+        new = self._sample(self.budget - np.sum(self.enabled),
+                           self.enabled | removed)
+        self.enabled[new] = True
+        Wf[new] = self.w_init
+        owner.Wf = Wf
+        owner.enabled = self.enabled.astype(float)
+        return self.pruned[-1]
+
+    def run(self, duration:b2.Quantity, **kwargs):
+        """Run the network, with a structural plasticity step every interval
+
+        Args:
+            duration (b2.Quantity): Duration of the run
+            **kwargs: Other arguments of brian2.Network.run (e.g. namespace)
+        """
+        steps = int(duration/self.interval)
+        for _ in range(steps):
+            self.net.run(self.interval, **kwargs)
+            self.step()
+        rest = duration - steps*self.interval
+        if rest > 0*b2.second:
+            self.net.run(rest, **kwargs)
@@ -0,0 +1,241 @@
+import brian2 as b2
+import itertools
+import multiprocessing
+import numpy as np
+import os
+
+from neuron_model import model_namespace
+
+# Weight parameters of Area and connect, indexed by the roles of the
+# (projecting, receiving) populations of the synapses they set
+weight_roles = {('interNPE', 'NPE'): 'wINHIPE',
+                ('interPPE', 'PPE'): 'wINHIPE',
+                ('IR', 'PPE'): 'wEXCIPE',
+                ('IR', 'NPE'): 'wEXCIPE',
+                ('interIR', 'IR'): 'wINHIIR',
+                ('NPE', 'IR'): 'wEXCIIR',
+                ('PPE', 'IR'): 'wEXCIIR'}
+
+def role(group:b2.Group):
+    """Role of a population built by Area ('IR', 'NPE', 'interPPE', ...)
+
+    Args:
+        group (b2.Group): The population
+
+    Returns:
+        str: The role, i.e. the end of the name of the population
+    """
+    return group.name.rsplit('_', 1)[-1]
+
+def weight_synapses(net:b2.Network):
+    """Find the synapses of a network built with Area and connect whose
+    weights are set by each of wINHIPE, wEXCIPE, wINHIIR and wEXCIIR
+
+    Args:
+        net (b2.Network): The network
+
+    Returns:
+        dict: Lists of brian2.Synapses indexed by weight parameter name
+    """
+    found = {name: list() for name in set(weight_roles.values())}
+    for obj in net.objects:
+        if isinstance(obj, b2.Synapses):
+            key = (role(obj.source), role(obj.target))
+            if key in weight_roles:
+                found[weight_roles[key]].append(obj)
+    return found
+
+def summary(net:b2.Network, duration:b2.Quantity=None):
+    """Compact summary of a simulation: spike counts of each neuron of the
+    recorded populations and learned prediction weights
+
+    Args:
+        net (b2.Network): The network, after the simulation
+        duration (b2.Quantity, optional): Duration of the simulation. If
+                                          given, the mean firing rate (in
+                                          Hz) of each recorded population is
+                                          added, indexed by monitor name +
+                                          '_rate'. Defaults to None.
+
+    Returns:
+        dict: Spike counts (np.ndarray) indexed by monitor name, and Wf
+              (np.ndarray) indexed by synapses name
+    """
+    results = dict()
+    for obj in net.objects:
+        if isinstance(obj, b2.SpikeMonitor):
+            results[obj.name] = np.array(obj.count[:])
+            if duration is not None:
+                results[obj.name+'_rate'] = float(np.mean(obj.count[:])
+                                                  / (duration/b2.second))
+        elif isinstance(obj, b2.Synapses) and 'Wf' in obj.variables \
+             and obj.variables['Wf'].owner.name == obj.name:
+            results[obj.name+'_Wf'] = np.array(obj.Wf[:])
+    return results
+
+
+class CompiledSweep:
+    """Network built with Area and connect, compiled once with the
+    cpp_standalone device, and run for many parameter points without new
+    code generation or compilation: the weights wINHIPE, wEXCIPE, wINHIIR,
+    wEXCIIR and the firing rates of the Poisson inputs are passed as
+    run-time arguments of the compiled binary.
+    brian2genn does not support run-time arguments, so this uses the C++
+    standalone device instead of set_device('genn').
+
+    Args:
+        build (callable): Function building the network. It is called as
+                          build(net, **kwargs) and returns a dict of the
+                          brian2.TimedArray used by Area.set_rates, indexed
+                          by the name given to set_rates
+        duration (b2.Quantity): Duration of each simulation
+        directory (str, optional): Directory of the compiled project.
+                                   Defaults to 'sweep'.
+        Any keyword argument is passed to build
+    """
+
+    def __init__(self, build:callable, duration:b2.Quantity,
+                 directory:str='sweep', **kwargs):
+        b2.set_device('cpp_standalone', build_on_run=False,
+                      directory=directory)
+        self.directory = directory
+        self.duration = duration
+        self.net = b2.Network()
+        self.inputs = build(self.net, **kwargs) or dict()
+        self.weights = weight_synapses(self.net)
+        self.net.run(duration, namespace=dict(model_namespace,
+                                              **self.inputs))
+        b2.device.build(directory=directory, run=False)
+
+    def run(self, rates:dict=None, **weights):
+        """Run the compiled network for one parameter point
+
+        Args:
+            rates (dict, optional): Firing rates (b2.Quantity arrays in Hz,
+                                    of the same shape as the TimedArrays
+                                    returned by build) indexed by TimedArray
+                                    name. Inputs not given keep the rates
+                                    they were built with. Defaults to None.
+            Weights wINHIPE, wEXCIPE, wINHIIR and/or wEXCIIR as floats (in
+            mV, as for Area and connect). Weights not given keep the value
+            they were built with.
+
+        Returns:
+            dict: The summary of the simulation (see summary)
+        """
+        run_args = dict()
+        for name, w in weights.items():
+            for s in self.weights[name]:
+                run_args[s.w_syn] = w*b2.mV
+        for name, values in (rates or dict()).items():
+            run_args[self.inputs[name]] = values
+        b2.device.run(directory=self.directory, run_args=run_args)
+        return summary(self.net, self.duration)
+
+    def sweep(self, points:list):
+        """Run the compiled network for a list of parameter points
+
+        Args:
+            points (list): List of dicts of keyword arguments of run
+
+        Returns:
+            list of dict: The summaries of the simulations
+        """
+        return [self.run(**point) for point in points]
+
+
+def grid(**params):
+    """Parameter grid: all combinations of the given parameter values
+
+    Args:
+        Lists of values indexed by parameter name
+
+    Returns:
+        list of dict: Parameter points
+    """
+    names = list(params)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(params[n] for n in names))]
+
+def _run_point(args:tuple):
+    """Build and run the network of one parameter point, in a worker of
+    grid_sweep
+
+    Args:
+        args (tuple): (build, duration, point, seed, directory, standalone)
+
+    Returns:
+        dict: The summary of the simulation (see summary)
+    """
+    build, duration, point, seed, directory, standalone = args
+    if standalone:
+        b2.set_device('cpp_standalone', directory=directory,
+                      with_output=False)
+        b2.device.reinit()
+        b2.device.activate(directory=directory, with_output=False)
+    else:
+        b2.set_device('runtime')
+        b2.prefs.codegen.runtime.cython.cache_dir = os.path.join(directory,
+                                                                 'cython')
+    b2.seed(seed)
+    np.random.seed(seed)
+    net = b2.Network()
+    inputs = build(net, **point) or dict()
+    net.run(duration, namespace=dict(model_namespace, **inputs))
+    return summary(net, duration)
+
+def grid_sweep(build:callable, points:list, duration:b2.Quantity,
+               processes:int=None, seed:int=0, directory:str='sweeps',
+               standalone:bool=True):
+    """Run a network built with Area and connect for many parameter points
+    (e.g. wINHIPE, wEXCIPE, lr, twindow, wmax) on a pool of processes. Each
+    point is built and run in a fresh process, with its own seed and its own
+    build (standalone) or cache (runtime) directory.
+
+    Args:
+        build (callable): Function building the network, see CompiledSweep.
+                          It is called as build(net, **point), and must be
+                          defined at the top level of a module so that it
+                          can be sent to the workers
+        points (list): List of dicts of keyword arguments of build, e.g.
+                       from grid
+        duration (b2.Quantity): Duration of each simulation
+        processes (int, optional): Number of processes. Defaults to None,
+                                   i.e. the number of CPU cores.
+        seed (int, optional): Seed of the first point, point k is seeded
+                              with seed+k. Defaults to 0.
+        directory (str, optional): Directory holding one subdirectory per
+                                   point. Defaults to 'sweeps'.
+        standalone (bool, optional): If True then use the cpp_standalone
+                                     device, else the runtime device.
+                                     Defaults to True.
+
+    Returns:
+        dict: Table of results, with one column (np.ndarray of len(points)
+              rows) per parameter and per entry of the summaries
+    """
+    tasks = [(build, duration, point, seed+k,
+              os.path.abspath(os.path.join(directory, 'point%d' % k)),
+              standalone) for k, point in enumerate(points)]
+    with multiprocessing.Pool(processes, maxtasksperchild=1) as pool:
+        results = pool.map(_run_point, tasks)
+    rows = [dict(point, **result) for point, result in zip(points, results)]
+    return table(rows)
+
+def table(rows:list):
+    """Gather the rows of a sweep into columns
+
+    Args:
+        rows (list): List of dicts with the same keys
+
+    Returns:
+        dict: One np.ndarray per key, stacking the values of the rows
+    """
+    columns = dict()
+    for key in rows[0] if rows else []:
+        values = [row[key] for row in rows]
+        try:
+            columns[key] = np.stack([np.asarray(v) for v in values])
+        except ValueError:
+            columns[key] = np.array(values+[None], dtype=object)[:-1]
+    return columns
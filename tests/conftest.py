@@ -0,0 +1,55 @@
+import numpy as np
+import os
+import pytest
+import sys
+
+# The modules of the repository are imported from its root, as by simple.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def runtime():
+    """Runtime device with numpy code generation (nothing to compile), the
+    default time step and fixed seeds for every test"""
+    b2 = pytest.importorskip('brian2')
+    b2.set_device('runtime')
+    b2.prefs.codegen.target = 'numpy'
+    b2.defaultclock.dt = .1*b2.ms
+    b2.seed(0)
+    np.random.seed(0)
+
+    # Networks of a test are dropped at its end, without being run
+    b2.BrianLogger.suppress_name('unused_brian_object')
+
+
+@pytest.fixture
+def two_areas():
+    """Builder of a small two-area network: a lower area with Poisson
+    internal representations drawn in advance (IRgenerator) and a higher
+    area with free internal representations, as in experiment 2 of
+    simple.py, or as in experiment 5 (both areas Poisson) with plastic
+    prediction weights"""
+    import brian2 as b2
+    from modules import Area, connect
+
+    def build(net, plastic=False, seed=1, **kwargs):
+        b2.seed(seed)
+        np.random.seed(seed)
+        low = b2.TimedArray(65*np.array([[1, 0, 1], [0, 1, 1],
+                                         [1, 0, 1]])*b2.Hz, dt=.5*b2.second)
+        high = b2.TimedArray(65*np.array([[1, 0], [0, 1], [1, 0]])*b2.Hz,
+                             dt=.5*b2.second)
+        LOW = Area(3, 'LOW', net, -25, 12, -20, 25, IRPoisson=True,
+                   IRgenerator=True, recordspikes=True,
+                   tointerneurons=plastic, **kwargs)
+        HIGH = Area(2, 'HIGH', net, -25, 12, -20, 25, IRPoisson=plastic,
+                    IRgenerator=True, onlyIR=True, recordspikes=True,
+                    tointerneurons=plastic, **kwargs)
+        LOW.set_rates('low', low)
+        if plastic:
+            HIGH.set_rates('high', high)
+        W = np.array([[0, 0, 1], [1, 0, 1]]) if plastic \
+            else np.array([[1, 0, 1], [0, 1, 1]])
+        connect(HIGH, LOW, W, 12, 25, plastic=plastic)
+        return LOW, HIGH
+    return build
@@ -0,0 +1,32 @@
+import brian2 as b2
+import numpy as np
+
+from checkpoint import _state_variables, load_checkpoint, save_checkpoint
+from neuron_model import model_namespace
+
+
+def state(net):
+    return {'%s.%s' % (obj.name, name): obj.variables[name].get_value().copy()
+            for obj in net.objects
+            if isinstance(obj, (b2.NeuronGroup, b2.Synapses))
+            for name in _state_variables(obj)}
+
+def test_resume_bit_identical(two_areas, tmp_path):
+    path = str(tmp_path / 'checkpoint.npz')
+    net = b2.Network()
+    two_areas(net, plastic=True)
+    net.run(.3*b2.second, namespace=model_namespace)
+    save_checkpoint(net, path)
+    net.run(.4*b2.second, namespace=model_namespace)
+
+    resumed = b2.Network()
+    two_areas(resumed, plastic=True)
+    load_checkpoint(resumed, path)
+    resumed.run(.4*b2.second, namespace=model_namespace)
+
+    assert resumed.t == net.t
+    reference, test = state(net), state(resumed)
+    assert reference.keys() == test.keys()
+    assert np.any(reference['s_HIGH_IR_LOW_NPE.Wf'] != 1)
+    for key in reference:
+        np.testing.assert_array_equal(test[key], reference[key], key)
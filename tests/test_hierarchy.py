@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from hierarchy import build_hierarchy
+
+
+areas = [{'N': 3, 'name': 'LOW', 'wINHIPE': -25, 'wEXCIPE': 12,
+          'IRPoisson': True},
+         {'N': 2, 'name': 'MID', 'wINHIPE': -25, 'wEXCIPE': 12},
+         {'N': 2, 'name': 'HIGH', 'wINHIPE': -25, 'wEXCIPE': 12,
+          'onlyIR': True}]
+W = np.array([[1, 0, 1], [0, 1, 1]])
+
+def test_duplicate_edge_skipped():
+    edges = [{'high': 'MID', 'low': 'LOW', 'W': W, 'wEXCIPE': 12},
+             {'high': 'MID', 'low': 'LOW', 'W': 2*W, 'wEXCIPE': 12}]
+    with pytest.warns(UserWarning, match='duplicate edge MID -> LOW'):
+        net, built, _ = build_hierarchy(areas, edges)
+    assert len(net['s_MID_IR_LOW_NPE']) == np.count_nonzero(W)
+    assert set(built) == {'LOW', 'MID', 'HIGH'}
+
+def test_zero_edge_skipped():
+    edges = [{'high': 'MID', 'low': 'LOW', 'W': W, 'wEXCIPE': 12},
+             {'high': 'HIGH', 'low': 'MID', 'W': np.zeros((2, 2)),
+              'wEXCIPE': 12}]
+    with pytest.warns(UserWarning, match='edge HIGH -> MID of weight 0'):
+        net, _, _ = build_hierarchy(areas, edges)
+    assert 's_MID_IR_LOW_NPE' in net
+    for name in ('s_HIGH_IR_MID_NPE', 's_MID_NPE_HIGH_interIR',
+                 's_HIGH_IR_MID_interPPE', 's_MID_PPE_HIGH_IR'):
+        assert name not in net
+
+def test_mask_edge():
+    mask = np.array([[1, 1, 0], [0, 1, 1]], dtype=bool)
+    net, _, _ = build_hierarchy(areas, [{'high': 'MID', 'low': 'LOW',
+                                         'mask': mask, 'wEXCIPE': 12}])
+    s = net['s_MID_IR_LOW_NPE']
+    assert sorted(zip(s.i[:], s.j[:])) == sorted(zip(*np.nonzero(mask)))
+
+def test_duplicate_area_name():
+    with pytest.raises(ValueError, match='LOW is used twice'):
+        build_hierarchy(areas + [areas[0]], [])
@@ -0,0 +1,44 @@
+import brian2 as b2
+import numpy as np
+import pytest
+
+from neuron_model import model_namespace
+from validation import spikes
+
+
+def simulate(build, duration=1*b2.second, **kwargs):
+    net = b2.Network()
+    build(net, **kwargs)
+    net.run(duration, namespace=model_namespace)
+    return spikes(net)
+
+@pytest.mark.parametrize('layout', [{'fused': True}, {'onetoone': True},
+                                    {'fused': True, 'onetoone': True}])
+def test_fused_onetoone_same_spikes(two_areas, layout):
+    reference = simulate(two_areas)
+    test = simulate(two_areas, **layout)
+    assert reference.keys() == test.keys()
+    assert sum(len(i) for i, _, _ in reference.values()) > 0
+    for monitor, (i, t, n) in reference.items():
+        np.testing.assert_array_equal(test[monitor][0], i, monitor)
+        np.testing.assert_array_equal(test[monitor][1], t, monitor)
+
+def test_reduced_statistics(two_areas):
+    net = b2.Network()
+    LOW, _ = two_areas(net)
+    LOW.record_variables('NPE', 'full', ['vm', 'w'])
+    LOW.record_variables('NPE', 'stats', ['vm', 'w'], reduce=True)
+    net.run(.3*b2.second, namespace=model_namespace)
+    full, stats = net['LOW_full_RECORD'], net['LOW_stats_RECORD']
+    for v in ('vm', 'w'):
+        x = np.asarray(getattr(full, v)[:])
+        mean = np.asarray(getattr(stats, v+'_mean')[0])
+        var = np.asarray(getattr(stats, v+'_var')[0])
+
+        # Statistics recorded at a time step are those of the values
+        # recorded at the previous one
+        np.testing.assert_allclose(mean[1:], x.mean(0)[:-1], rtol=1e-12,
+                                   atol=1e-12*np.max(np.abs(mean)))
+        np.testing.assert_allclose(var[1:], x.var(0)[:-1], rtol=1e-9,
+                                   atol=1e-12*np.max(var))
+        assert np.all(var >= 0)
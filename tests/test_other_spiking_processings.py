@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+
+from other_spiking_processings import conv_connectivity
+
+
+@pytest.mark.parametrize('in_shape, stride', [((7, 5), 1), ((6, 8, 4), 2)])
+def test_per_channel_kernel(in_shape, stride):
+    kernel = np.random.default_rng(0).normal(size=(5, 3))
+    c = in_shape[2] if len(in_shape) == 3 else 1
+    full = np.eye(c)[:, :, None, None] * kernel
+    depthwise = conv_connectivity(in_shape, kernel, stride)
+    reference = conv_connectivity(in_shape, full, stride)
+    for a, b in zip(depthwise[:3], reference[:3]):
+        np.testing.assert_array_equal(a, b)
+    assert depthwise[3] == reference[3]
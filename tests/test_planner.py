@@ -0,0 +1,36 @@
+import brian2 as b2
+import numpy as np
+import pytest
+import scipy.sparse
+
+from modules import Area, connect
+from planner import Plan
+
+
+@pytest.mark.parametrize('layout', [{}, {'batch': 2},
+                                    {'fused': True, 'onetoone': True,
+                                     'skipzero': True}])
+@pytest.mark.parametrize('plastic', [False, True])
+def test_counts_match_built_network(layout, plastic):
+    net, plan, areas = b2.Network(), Plan(), dict()
+    specs = [((6, 'L', -25, 12), {'IRPoisson': True, 'recordspikes': True}),
+             ((4, 'M', -25, 12, -20, 25), {'recordspikes': True}),
+             ((3, 'H', -25, 12), {'lateralplasticity': True, 'lateral': 2,
+                                  'onlyIR': True})]
+    for (N, name, *weights), kwargs in specs:
+        plan.area(N, name, None, *weights, **kwargs, **layout)
+        areas[name] = Area(N, name, net, *weights, **kwargs, **layout)
+    for seed, (high, low) in enumerate((('M', 'L'), ('H', 'M'))):
+        W = scipy.sparse.random(areas[high].N, areas[low].N, density=.5,
+                                random_state=seed, format='csr')
+        plan.connect(high, low, W, 12, 25, plastic=plastic)
+        connect(areas[high], areas[low], W, 12, 25, plastic=plastic)
+
+    built = {obj.name: obj for obj in net.objects}
+    assert {name: len(built[name]) for name in plan.groups} \
+           == {name: group['n'] for name, group in plan.groups.items()}
+    assert {name: len(obj) for name, obj in built.items()
+            if isinstance(obj, b2.Synapses)} \
+           == {name: s['count'] for name, s in plan.synapses.items()}
+    assert set(plan.monitors) == {name for name, obj in built.items()
+                                  if isinstance(obj, b2.SpikeMonitor)}
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from poisson import poisson_spikes
+
+
+@pytest.mark.parametrize('rate', [65., 250.])
+def test_rate_and_refractory(rate):
+    refractory = 3e-3
+    rng = np.random.default_rng(0)
+    rates = np.full((20, 2000), rate)
+    rates[1::4, ::2] = 0
+    i, t = poisson_spikes(rates, .05, refractory, rng)
+    assert np.all(np.diff(t) >= 0)
+
+    # Mean rate over the windows of nonzero rate, within 1%
+    expected = np.sum(rates)*.05
+    assert abs(len(t) - expected) < .01*expected
+
+    # Refractory period respected across the window boundaries
+    order = np.lexsort((t, i))
+    same = np.diff(i[order]) == 0
+    assert np.min(np.diff(t[order])[same]) >= refractory - 1e-12
+
+def test_rate_above_refractory_limit():
+    with pytest.raises(ValueError):
+        poisson_spikes(np.array([[400.]]), 1., 3e-3)
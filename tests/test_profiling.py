@@ -0,0 +1,22 @@
+import brian2 as b2
+
+from neuron_model import model_namespace
+from profiling import Profiler
+
+
+def test_kinds(two_areas):
+    net = b2.Network()
+    two_areas(net)
+    profiler = Profiler(net)
+    profiler.run(50*b2.ms, namespace=model_namespace)
+    report = profiler.report()
+
+    # Every code object has an owner, monitors included (they name their
+    # code object after themselves)
+    assert all(c['kind'] != 'other' for c in report['codeobjects'])
+    low, high = report['areas']['LOW'], report['areas']['HIGH']
+    assert low['monitor']['time'] > 0 and high['monitor']['time'] > 0
+    assert low['profiler']['time'] > 0
+    assert low['input']['spikes'] > 0
+    assert {'NPE', 'PPE', 'prediction synapses'} <= set(low)
+    assert low['prediction synapses']['events'] > 0
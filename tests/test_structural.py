@@ -0,0 +1,57 @@
+import brian2 as b2
+import numpy as np
+
+from modules import Area
+from neuron_model import model_namespace
+from structural import StructuralPlasticity
+
+
+def areas(net):
+    """Lower and higher Poisson areas, as in experiment 5 of simple.py"""
+    rates = b2.TimedArray(65*np.array([[1, 0, 1], [0, 1, 1]])*b2.Hz,
+                          dt=.5*b2.second)
+    LOW = Area(3, 'LOW', net, -25, 12, -20, 25, IRPoisson=True,
+               IRgenerator=True, tointerneurons=True)
+    HIGH = Area(2, 'HIGH', net, -25, 12, -20, 25, IRPoisson=True,
+                IRgenerator=True, onlyIR=True, tointerneurons=True)
+    LOW.set_rates('low', rates)
+    HIGH.set_rates('high', b2.TimedArray(rates.values[:, :2]*b2.Hz,
+                                         dt=.5*b2.second))
+    return HIGH, LOW
+
+def test_prune_and_regrow():
+    net = b2.Network()
+    HIGH, LOW = areas(net)
+
+    # Frozen weights (lr=0): the synapse HIGH 1 -> LOW 0 starts below floor
+    W = np.array([[0, 0, 1], [.05, 0, 1]])
+    sp = StructuralPlasticity(HIGH, LOW, W, 12, budget=3, patience=2,
+                              interval=50*b2.ms, lr=0.)
+    synapses = {obj.name: obj for obj in net.objects
+                if isinstance(obj, b2.Synapses)}
+    keys = np.ravel_multi_index(np.nonzero(W), W.shape)
+    assert np.all(sp.enabled[np.searchsorted(sp.keys, keys)])
+    sp.run(200*b2.ms, namespace=model_namespace)
+
+    # Removed after patience checks and replaced by a new pair, without
+    # rebuilding the synapses
+    assert sp.pruned == [0, 1, 0, 0]
+    assert synapses == {obj.name: obj for obj in net.objects
+                        if isinstance(obj, b2.Synapses)}
+    owner = net['s_HIGH_IR_LOW_NPE']
+    Wf, enabled = np.asarray(owner.Wf[:]), np.asarray(owner.enabled[:])
+    assert np.sum(enabled) == 3 and np.array_equal(enabled, sp.enabled)
+    removed = np.searchsorted(sp.keys, np.ravel_multi_index((1, 0), W.shape))
+    assert not enabled[removed] and Wf[removed] == 0
+    assert np.all(Wf[~sp.enabled] == 0)
+    assert sorted(Wf[sp.enabled]) == [.5, 1, 1]
+
+def test_disabled_synapses_do_not_learn():
+    net = b2.Network()
+    HIGH, LOW = areas(net)
+    sp = StructuralPlasticity(HIGH, LOW, np.full((2, 3), .5), 12,
+                              budget=2, lr=.2)
+    net.run(1*b2.second, namespace=model_namespace)
+    Wf = np.asarray(net['s_HIGH_IR_LOW_NPE'].Wf[:])
+    assert np.sum(sp.enabled) == 2 and np.all(Wf[~sp.enabled] == 0)
+    assert np.any(Wf[sp.enabled] != .5)
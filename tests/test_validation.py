@@ -0,0 +1,22 @@
+import brian2 as b2
+import numpy as np
+
+from validation import agreement, rate_error, validate_neurons
+
+
+def test_agreement_and_rate_error():
+    i = np.array([0, 0, 1, 1])
+    t = np.array([.01, .25, .05, .33])
+    assert agreement((i, t, 2), (i, t+5e-4, 2), 1e-3) == 1.
+    assert agreement((i, t, 2), (i, t+2e-3, 2), 1e-3) == 0.
+
+    # Shifted spikes that stay in their window keep the same rates
+    assert rate_error((i, t, 2), (i, t+2e-3, 2), .4, .1) == 0.
+    assert rate_error((i, t, 2), (i[:2], t[:2], 2), .4, .1) == .5
+
+def test_validate_neurons_same_method():
+    results = validate_neurons('euler', .1*b2.ms, reference_dt=.1*b2.ms,
+                               duration=200*b2.ms, n=4)
+    assert results['bound'] == {'agreement': 1., 'count_error': 0.,
+                                'rate_error': 0.}
+    assert {'pe', 'pe_inputs', 'ir', 'ir_inputs'} <= set(results)
@@ -0,0 +1,319 @@
+import brian2 as b2
+import numpy as np
+
+from neuron_model import behaviors, model_namespace, neurons, set_precision
+
+
+def spikes(net:b2.Network):
+    """Spikes recorded by the SpikeMonitors of a network
+
+    Args:
+        net (b2.Network): The network, after the simulation
+
+    Returns:
+        dict: Tuples (neuron indices, spike times in s, number of neurons)
+              indexed by monitor name
+    """
+    return {obj.name: (np.array(obj.i[:]), np.array(obj.t[:]/b2.second),
+                       len(obj.source))
+            for obj in net.objects if isinstance(obj, b2.SpikeMonitor)}
+
+def weights(net:b2.Network):
+    """Prediction weights Wf of the plastic synapses of a network
+
+    Args:
+        net (b2.Network): The network, after the simulation
+
+    Returns:
+        dict: Arrays of weights indexed by synapses name
+    """
+    return {obj.name: np.array(obj.variables['Wf'].get_value())
+            for obj in net.objects if isinstance(obj, b2.Synapses)
+            and 'Wf' in obj.variables
+            and obj.variables['Wf'].owner.name == obj.name}
+
+def agreement(reference:tuple, test:tuple, tolerance:float):
+    """Agreement of two recordings of the same population: fraction of the
+    spikes of each that have a spike of the same neuron within tolerance in
+    the other
+
+    Args:
+        reference (tuple): (neuron indices, spike times in s, number of
+                           neurons), see spikes
+        test (tuple): Same for the recording to check
+        tolerance (float): Tolerance in s
+
+    Returns:
+        float: The smallest of the two fractions (1 if both are empty)
+    """
+    def matched(a, b):
+        (ia, ta, _), (ib, tb, _) = a, b
+        if len(ia) == 0:
+            return 1.
+
+        # Spikes of b sorted by neuron then time, so that each spike of a is
+        # compared to its neighbours among the spikes of the same neuron
+        key = ib*1e6 + tb
+        order = np.argsort(key)
+        key = key[order]
+        k = np.searchsorted(key, ia*1e6 + ta)
+        best = np.full(len(ia), np.inf)
+        for kk in (k-1, k):
+            ok = (kk >= 0) & (kk < len(key))
+            d = np.full(len(ia), np.inf)
+            d[ok] = np.abs(key[kk[ok]] - (ia[ok]*1e6 + ta[ok]))
+            best = np.minimum(best, d)
+        return float(np.mean(best <= tolerance))
+    return min(matched(reference, test), matched(test, reference))
+
+def rate_error(reference:tuple, test:tuple, duration:float, window:float):
+    """Relative error on the firing rates of two recordings of the same
+    population: spike counts of each neuron in consecutive windows, which
+    unlike agreement does not require the spike times to stay aligned
+
+    Args:
+        reference (tuple): (neuron indices, spike times in s, number of
+                           neurons), see spikes
+        test (tuple): Same for the recording to check
+        duration (float): Duration of the recordings in s
+        window (float): Duration of the windows in s
+
+    Returns:
+        float: Sum over neurons and windows of the absolute count 
+               differences, over the number of spikes of reference
+    """
+    bins = int(np.ceil(duration/window))
+    def counts(i, t, n):
+        k = np.minimum((t/window).astype(int), bins-1)
+        return np.bincount(i*bins + k, minlength=n*bins)
+    ref = counts(*reference)
+    return float(np.abs(counts(*test) - ref).sum() / max(ref.sum(), 1))
+
+def _run(build:callable, duration:b2.Quantity, method:str,
+         dt:b2.Quantity, seed:int=0, precision:str='double'):
+    """Build and run a network with the runtime device, see simulate. The
+    precision and the time step of the default clock are restored afterwards.
+
+    Returns:
+        b2.Network: The network, after the simulation
+    """
+    b2.set_device('runtime')
+    set_precision(precision)
+    default_dt = b2.defaultclock.dt
+    try:
+        b2.defaultclock.dt = dt
+        b2.seed(seed)
+        net = b2.Network()
+        inputs = build(net, method=method, IRgenerator=True) or dict()
+        net.run(duration, namespace=dict(model_namespace, **inputs))
+    finally:
+        set_precision('double')
+        b2.defaultclock.dt = default_dt
+    return net
+
+def simulate(build:callable, duration:b2.Quantity, method:str,
+             dt:b2.Quantity, seed:int=0, precision:str='double'):
+    """Build and run a network with the runtime device
+
+    Args:
+        build (callable): Function building the network, called as
+                          build(net, method=method, IRgenerator=True), such
+                          as the build functions of simple.py. Poisson
+                          inputs are drawn in advance so that they are the
+                          same whatever the time step.
+        duration (b2.Quantity): Duration of the simulation
+        method (str): Integration method, see neuron_model.neurons
+        dt (b2.Quantity): Time step
+        seed (int, optional): Random seed. Defaults to 0.
+        precision (str, optional): Floating point precision, see
+                                   neuron_model.set_precision. Defaults to
+                                   'double'.
+
+    Returns:
+        dict: The recorded spikes, see spikes
+    """
+    return spikes(_run(build, duration, method, dt, seed, precision))
+
+def validate(experiments:dict, method:str, dt:b2.Quantity,
+             reference_dt:b2.Quantity=.1*b2.ms,
+             tolerance:b2.Quantity=1*b2.ms, window:b2.Quantity=100*b2.ms,
+             seed:int=0):
+    """Compare an integration method and time step with the Euler method at
+    reference_dt on a set of experiments, e.g.
+    validate({'exp1': (simple.build1, 4*b2.second), ...}, 'rk2', .5*b2.ms).
+    The 20 ms delay of the lateral synapses of free internal
+    representations amplifies any change of a spike time by a time step at
+    every cycle, so spike times decorrelate whatever the method and the
+    agreement is close to 0 as soon as dt differs: compare the rate errors,
+    or the methods on isolated populations with validate_neurons.
+
+    Args:
+        experiments (dict): Tuples (build, duration) indexed by experiment
+                            name, see simulate
+        method (str): Integration method to check
+        dt (b2.Quantity): Time step to check
+        reference_dt (b2.Quantity, optional): Time step of the reference
+                                              Euler simulation. Defaults to
+                                              0.1 ms.
+        tolerance (b2.Quantity, optional): Tolerance on spike times.
+                                           Defaults to 1 ms.
+        window (b2.Quantity, optional): Window of the rate error (see 
+                                        rate_error). Defaults to 100 ms.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        dict: For each experiment and monitor, a dict with the spike time
+              agreement (see agreement), the relative error on the number
+              of spikes and the rate error (see rate_error). Entry 'bound'
+              holds the worst of each over all of them.
+    """
+    results = dict()
+    for name, (build, duration) in experiments.items():
+        reference = simulate(build, duration, 'euler', reference_dt, seed)
+        test = simulate(build, duration, method, dt, seed)
+        results.update(_compare(name, reference, test, duration, tolerance,
+                                window))
+    return dict(results, bound=_bound(results))
+
+def validate_neurons(method:str, dt:b2.Quantity, 
+                     reference_dt:b2.Quantity=.01*b2.ms, 
+                     duration:b2.Quantity=1*b2.second, n:int=20,
+                     currents:tuple=(.6*b2.nA, 2*b2.nA), rate:float=200.,
+                     w:float=4., tolerance:b2.Quantity=1*b2.ms,
+                     window:b2.Quantity=100*b2.ms, seed:int=0):
+    """Compare an integration method and time step with the Euler method at
+    reference_dt on isolated populations of each behavior (see 
+    neuron_model.behaviors), without the recurrent delays of the
+    experiments (see validate), so that spike times only differ by the
+    integration error. Each population receives constant currents spanning
+    currents, alone and with Poisson input spikes of weight w mV (drawn in
+    advance, on a 1 ms grid so that they fall on the same time steps).
+
+    Args:
+        method (str): Integration method to check
+        dt (b2.Quantity): Time step to check
+        reference_dt (b2.Quantity, optional): Time step of the reference
+                                              Euler simulation. Defaults to
+                                              0.01 ms.
+        duration (b2.Quantity, optional): Duration of the simulations.
+                                          Defaults to 1 s.
+        n (int, optional): Number of neurons of each population. Defaults to
+                           20.
+        currents (tuple, optional): Smallest and largest currents. Defaults
+                                    to 0.6 and 2 nA.
+        rate (float, optional): Rate of the Poisson inputs in Hz. Defaults 
+                                to 200.
+        w (float, optional): Weight of the Poisson inputs in mV. Defaults to
+                             4.
+        tolerance (b2.Quantity, optional): Tolerance on spike times.
+                                           Defaults to 1 ms.
+        window (b2.Quantity, optional): Window of the rate error (see 
+                                        rate_error). Defaults to 100 ms.
+        seed (int, optional): Random seed of the inputs. Defaults to 0.
+
+    Returns:
+        dict: For each behavior, without ('<behavior>') and with 
+              ('<behavior>_inputs') Poisson inputs, a dict with the spike
+              time agreement, the relative error on the number of spikes and
+              the rate error. Entry 'bound' holds the worst of each.
+    """
+    rng = np.random.default_rng(seed)
+    times = rng.random((n, int(duration/b2.ms))) < rate*1e-3
+    indices, steps = np.nonzero(times)
+    def build(net, method, **kwargs):
+        for behavior in behaviors:
+            for inputs in (False, True):
+                name = behavior + ('_inputs' if inputs else '')
+                group = neurons(n, behavior, name, net, method)
+                group.I = np.linspace(currents[0]/b2.nA, currents[1]/b2.nA,
+                                      n)*b2.nA
+                net.add(b2.SpikeMonitor(group, name=name+'_RECORD'))
+                if inputs:
+                    poisson = b2.SpikeGeneratorGroup(
+                        n, indices, steps*b2.ms, name=name+'_POISSON')
+                    s = b2.Synapses(poisson, group, on_pre='vm += %g*mV' % w,
+                                    name='s_%s_%s' % (poisson.name, name))
+                    s.connect(j='i')
+                    net.add(poisson, s)
+    reference = simulate(build, duration, 'euler', reference_dt)
+    test = simulate(build, duration, method, dt)
+    results = {name[:-len('_RECORD')]: result for name, result in
+               _compare('', reference, test, duration, tolerance,
+                        window).items()}
+    return dict(results, bound=_bound(results))
+
+def _compare(name:str, reference:dict, test:dict, duration:b2.Quantity,
+             tolerance:b2.Quantity, window:b2.Quantity):
+    """Agreement, count error and rate error of each monitor of two
+    simulations, indexed by name + '.' + monitor name (monitor name alone if
+    name is empty)"""
+    results = dict()
+    for monitor in reference:
+        n_ref, n_test = len(reference[monitor][0]), len(test[monitor][0])
+        results['%s.%s' % (name, monitor) if name else monitor] = {
+            'agreement': agreement(reference[monitor], test[monitor],
+                                   float(tolerance/b2.second)),
+            'count_error': abs(n_test-n_ref)/max(n_ref, 1),
+            'rate_error': rate_error(reference[monitor], test[monitor],
+                                     float(duration/b2.second),
+                                     float(window/b2.second))}
+    return results
+
+def _bound(results:dict):
+    """Worst agreement, count error and rate error of results"""
+    return {'agreement': min(r['agreement'] for r in results.values()),
+            'count_error': max(r['count_error'] for r in results.values()),
+            'rate_error': max(r['rate_error'] for r in results.values())}
+
+def validate_precision(experiments:dict, dt:b2.Quantity=.1*b2.ms,
+                       tolerance:b2.Quantity=1*b2.ms, threshold:float=.5,
+                       seed:int=0):
+    """Compare single precision with double precision on a set of
+    experiments, with the Euler method: spike statistics of each monitor
+    and prediction weights learned by plastic synapses
+
+    Args:
+        experiments (dict): Tuples (build, duration) indexed by experiment
+                            name, see simulate
+        dt (b2.Quantity, optional): Time step. Defaults to 0.1 ms.
+        tolerance (b2.Quantity, optional): Tolerance on spike times.
+                                           Defaults to 1 ms.
+        threshold (float, optional): Threshold above which a learned weight
+                                     counts as a connection. Defaults to .5.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        dict: For each experiment and monitor, a dict with the spike time
+              agreement (see agreement) and the relative error on the number
+              of spikes; for each experiment and plastic synapses, a dict
+              with the largest weight difference and whether the
+              thresholded weights are identical. Entry 'bound' holds the
+              worst of each over all of them.
+    """
+    results = dict()
+    for name, (build, duration) in experiments.items():
+        double = _run(build, duration, 'euler', dt, seed, 'double')
+        single = _run(build, duration, 'euler', dt, seed, 'single')
+        reference, test = spikes(double), spikes(single)
+        for monitor in reference:
+            n_ref, n_test = len(reference[monitor][0]), len(test[monitor][0])
+            results['%s.%s' % (name, monitor)] = {
+                'agreement': agreement(reference[monitor], test[monitor],
+                                       float(tolerance/b2.second)),
+                'count_error': abs(n_test-n_ref)/max(n_ref, 1)}
+        reference, test = weights(double), weights(single)
+        for syn in reference:
+            results['%s.%s' % (name, syn)] = {
+                'weight_error': float(np.max(np.abs(test[syn]-reference[syn]),
+                                             initial=0.)),
+                'same_learned': bool(np.array_equal(
+                    reference[syn] > threshold, test[syn] > threshold))}
+    results['bound'] = {
+        'agreement': min(r.get('agreement', 1.) for r in results.values()),
+        'count_error': max(r.get('count_error', 0.)
+                           for r in results.values()),
+        'weight_error': max(r.get('weight_error', 0.)
+                            for r in results.values()),
+        'same_learned': all(r.get('same_learned', True)
+                            for r in results.values())}
+    return results